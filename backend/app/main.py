@@ -55,6 +55,19 @@ app.include_router(tasks.router)
 app.include_router(notifications.router)
 app.include_router(attendance_router.router)
 
+
+@app.on_event("startup")
+def start_face_workers():
+    # Spawn the face worker processes now rather than on the first check-in
+    attendance_router.face_worker_pool.start()
+
+
+@app.on_event("shutdown")
+def stop_face_workers():
+    attendance_router.face_worker_pool.shutdown()
+    # Finish writing queued attendance images before exiting
+    attendance_router.image_writer.shutdown()
+
 # Mount the Face Attendance Flask app under /face
 try:
     flask_app = get_flask_app()
@@ -1,14 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import anyio
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime, date, timedelta
 import base64
 import os
 import sys
-import numpy as np
 import csv
 import io
+import json
+import logging
+import asyncio
+import time
+import zipfile
+import zlib
 
 from ..utils.deps import get_current_user, admin_or_manager
 from ..database import SessionLocal as MainSession
@@ -22,14 +29,37 @@ if backend_root not in sys.path:
     sys.path.insert(0, backend_root)
 
 from database import Session as FaceSession  # type: ignore
-from models import Employee, Attendance, FaceSample  # type: ignore
-from face_utils import get_face_encoding, compare_faces, compare_faces_multi, encoding_to_bytes, bytes_to_encoding  # type: ignore
+from models import Employee, Attendance, FaceSample, FacePrototype  # type: ignore
+from face_utils import (  # type: ignore
+    FaceResult, encode_image_bytes, encode_image_faces, encoding_to_bytes, is_current_encoding,
+)
+from face_gallery import get_gallery  # type: ignore
+from face_workers import face_worker_pool, FaceWorkersBusy, FaceWorkersRestarting  # type: ignore
+from image_store import image_writer  # type: ignore
+from attendance_state import DayState, get_attendance_state  # type: ignore
+from encoding_cache import encoding_cache, content_key  # type: ignore
 from config import Config  # type: ignore
-import cv2  # type: ignore
+from metrics import Histogram  # type: ignore
+
+logger = logging.getLogger(__name__)
 
 
 router = APIRouter(prefix="/attendance", tags=["attendance"])
 
+# Time DB and gallery work waits for a thread of the request threadpool
+threadpool_wait_ms = Histogram([1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500])
+
+
+async def _in_threadpool(fn, *args):
+    """run_in_threadpool(fn, *args), recording the wait for a thread in threadpool_wait_ms."""
+    submitted_at = time.monotonic()
+
+    def timed():
+        threadpool_wait_ms.observe((time.monotonic() - submitted_at) * 1000.0)
+        return fn(*args)
+
+    return await run_in_threadpool(timed)
+
 
 class RegisterFaceBody(BaseModel):
     user_id: int
@@ -105,52 +135,136 @@ def status_today(user=Depends(get_current_user)):
         face_db.close()
 
 
-@router.post("/register")
-def register_face(body: RegisterFaceBody, _=Depends(admin_or_manager)):
-    # Lookup main user
+def _decode_image(data_url: str) -> bytes:
+    """Extract the encoded image bytes from a base64 data URL."""
+    try:
+        payload = data_url.split(",", 1)[1] if "," in data_url else data_url
+        return base64.b64decode(payload)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+
+
+async def _run_face_pipeline(img_bytes: bytes, cached: bool = True):
+    """FaceResult for an upload from the face worker pool (may carry an error or issues).
+
+    With cached=True (recognition), byte-identical uploads are served from the
+    encoding cache (replayed=True). Registration passes cached=False: its
+    uploads are not replays and must not make a later check-in with the same
+    photo look like one.
+
+    Raises:
+        FaceWorkersBusy: If the worker queue is full or a worker died (FaceWorkersRestarting)
+    """
+    if not cached:
+        return await face_worker_pool.run(encode_image_bytes, img_bytes)
+    key = content_key(img_bytes)
+    face = encoding_cache.get(key)
+    if face is not None:
+        return face._replace(replayed=True)
+    face = await face_worker_pool.run(encode_image_bytes, img_bytes)
+    encoding_cache.put(key, face)
+    return face
+
+
+async def _encode_face(img_bytes: bytes, cached: bool = True):
+    """Decode, detect, quality-check and encode on the face worker pool; raise on failure.
+
+    Returns a FaceResult with the encoding, face box and quality score.
+    """
+    try:
+        face = await _run_face_pipeline(img_bytes, cached)
+    except FaceWorkersBusy:
+        raise HTTPException(status_code=503, detail="Face recognition is busy, please try again in a moment")
+    if face.error:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {face.error}")
+    if face.issues:
+        raise HTTPException(status_code=400, detail={"message": "Face quality issues", "issues": face.issues})
+    return face
+
+
+def _lookup_user(user_id: int):
+    """Return (name, email) of a main-app user or raise 404."""
     main_db = MainSession()
     try:
-        user_obj: Optional[User] = main_db.query(User).filter(User.id == body.user_id).first()
+        user_obj: Optional[User] = main_db.query(User).filter(User.id == user_id).first()
         if not user_obj:
             raise HTTPException(status_code=404, detail="User not found")
-        name = user_obj.name
-        email = user_obj.email
+        return user_obj.name, user_obj.email
     finally:
         main_db.close()
 
-    # Decode image data URL
+
+async def _read_upload(request: Request):
+    """Image bytes and parameters from a multipart or raw binary request.
+
+    multipart/form-data: the image is the "image" file field and parameters
+    are form fields. Any other content type (image/jpeg, application/octet-stream):
+    the body is the image itself and parameters come from the query string.
+    """
+    params = dict(request.query_params)
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("image")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Missing 'image' file field")
+        img_bytes = await upload.read()
+        params.update((key, value) for key, value in form.items() if isinstance(value, str))
+    else:
+        img_bytes = await request.body()
+    if not img_bytes:
+        raise HTTPException(status_code=400, detail="Invalid image: empty upload")
+    return img_bytes, params
+
+
+def _form_bool(value: Optional[str]) -> bool:
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+@router.post("/register")
+async def register_face(body: RegisterFaceBody, _=Depends(admin_or_manager)):
+    return await _register(body.user_id, body.add_sample, _decode_image(body.image))
+
+
+@router.post("/register/upload")
+async def register_face_upload(request: Request, _=Depends(admin_or_manager)):
+    """Binary variant of /register: raw JPEG/PNG bytes instead of a base64 data URL.
+
+    Parameters: user_id (required), add_sample (default false).
+    """
+    img_bytes, params = await _read_upload(request)
     try:
-        payload = body.image.split(",", 1)[1] if "," in body.image else body.image
-        img_bytes = base64.b64decode(payload)
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if frame is None:
-            raise ValueError("Failed to decode image")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+        user_id = int(params["user_id"])
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="user_id is required and must be an integer")
+    return await _register(user_id, _form_bool(params.get("add_sample")), img_bytes)
+
 
-    # Create encoding with quality checks
-    result = get_face_encoding(frame)
-    if result is None:
-        raise HTTPException(status_code=400, detail="No face detected")
-    encoding, quality_issues = result
-    if quality_issues:
-        raise HTTPException(status_code=400, detail={"message": "Face quality issues", "issues": quality_issues})
+async def _register(user_id: int, add_sample: bool, img_bytes: bytes):
+    # Lookup main user
+    name, email = await _in_threadpool(_lookup_user, user_id)
 
+    # Decode image and create encoding with quality checks
+    face = await _encode_face(img_bytes, cached=False)
+    return await _in_threadpool(_save_registration, user_id, add_sample, name, email, face)
+
+
+def _save_registration(user_id: int, add_sample: bool, name: str, email: str, face):
+    """Store a registration (new employee, updated primary or extra sample)."""
+    encoding = face.encoding
     face_db = FaceSession()
     try:
         existing = (
             face_db.query(Employee)
-            .filter((Employee.user_id == str(body.user_id)) | (Employee.email == email))
+            .filter((Employee.user_id == str(user_id)) | (Employee.email == email))
             .first()
         )
         
         # Calculate quality score
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        quality_score = float(cv2.Laplacian(gray, cv2.CV_64F).var() / 1000.0)  # Normalize
+        quality_score = face.quality_score  # Normalized whole-frame sharpness
         
         if existing:
-            if body.add_sample:
+            # A primary from a previous face encoder is replaced rather than given samples
+            if add_sample and is_current_encoding(existing.face_encoding):
                 # Add as additional training sample
                 sample = FaceSample(
                     employee_id=existing.id,
@@ -159,6 +273,7 @@ def register_face(body: RegisterFaceBody, _=Depends(admin_or_manager)):
                 )
                 face_db.add(sample)
                 face_db.commit()
+                get_gallery().add_sample(existing.id, sample.id, encoding, quality_score)
                 
                 # Count total samples
                 sample_count = face_db.query(FaceSample).filter(
@@ -174,115 +289,520 @@ def register_face(body: RegisterFaceBody, _=Depends(admin_or_manager)):
                 # Update primary encoding
                 existing.name = name
                 existing.email = email
-                existing.user_id = str(body.user_id)
+                existing.user_id = str(user_id)
                 existing.face_encoding = encoding_to_bytes(encoding)
+                # Prototypes were chosen among the old primary and samples
+                face_db.query(FacePrototype).filter(FacePrototype.employee_id == existing.id).delete()
                 face_db.commit()
                 face_db.refresh(existing)
+                get_gallery().set_primary(existing, encoding)
                 return {"message": "Face updated for user", "employee_id": existing.id}
         else:
             # Create new employee with primary encoding
             emp = Employee(
                 name=name,
                 email=email,
-                user_id=str(body.user_id),
+                user_id=str(user_id),
                 face_encoding=encoding_to_bytes(encoding),
             )
             face_db.add(emp)
             face_db.commit()
             face_db.refresh(emp)
+            get_gallery().set_primary(emp, encoding)
             return {"message": "Face registered", "employee_id": emp.id}
     finally:
         face_db.close()
 
 
-@router.post("/mark")
-def mark_attendance(body: MarkBody, user=Depends(get_current_user)):
-    action = body.action.lower()
+@router.post("/gallery/rebuild")
+def rebuild_gallery(_=Depends(admin_or_manager)):
+    """Reload the face gallery from the database and rebuild its ANN index in the background."""
+    get_gallery().rebuild_index_async(reload=True)
+    return {"message": "Gallery rebuild started"}
+
+
+@router.get("/metrics")
+async def face_pipeline_metrics(_=Depends(admin_or_manager)):
+    """Counters and histograms for tuning the face recognition pipeline."""
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter_stats = limiter.statistics()
+    return {
+        "face_workers": face_worker_pool.stats(),
+        "image_writer": image_writer.stats(),
+        "attendance_state": get_attendance_state().stats(),
+        "encoding_cache": encoding_cache.stats(),
+        "request_threadpool": {
+            "size": limiter_stats.total_tokens,
+            "busy": limiter_stats.borrowed_tokens,
+            "queued": limiter_stats.tasks_waiting,
+            "wait_ms": threadpool_wait_ms.snapshot(),
+        },
+        "gallery": get_gallery().memory_stats(),
+    }
+
+
+def _validate_action(action: str) -> str:
+    action = action.lower()
     if action not in ["check_in", "check_out"]:
         raise HTTPException(status_code=400, detail="Invalid action. Use 'check_in' or 'check_out'")
-    
-    # Decode image
+    return action
+
+
+@router.post("/mark")
+async def mark_attendance(body: MarkBody, user=Depends(get_current_user)):
+    """Self-service check-in: verify the face against the logged-in user only."""
+    action = _validate_action(body.action)
+    return await _mark_self(user, action, _decode_image(body.image))
+
+
+@router.post("/mark/upload")
+async def mark_attendance_upload(request: Request, user=Depends(get_current_user)):
+    """Binary variant of /mark: raw JPEG/PNG bytes; parameter action (default check_in)."""
+    img_bytes, params = await _read_upload(request)
+    action = _validate_action(params.get("action", "check_in"))
+    return await _mark_self(user, action, img_bytes)
+
+
+async def _mark_self(user, action: str, img_bytes: bytes):
+    # Requests that cannot change today's record are answered before the face pipeline
+    no_op = await _in_threadpool(_precheck_self, user, action)
+    if no_op is not None:
+        return no_op
+    face = await _encode_face(img_bytes)
+    return await _in_threadpool(_verify_and_record, user, action, face, img_bytes)
+
+
+def _precheck_self(user, action: str):
+    """Response for an idempotent self-service request from cached state, else None."""
+    claimed = get_gallery().employee_for_user(user["id"])
+    if claimed is None:
+        raise HTTPException(status_code=404, detail="No face registered for current user")
+    state = get_attendance_state().get(claimed.id, _load_day_state)
+    return _no_op_response(claimed, action, state, None)
+
+
+def _load_day_state(employee_id: int, day: date) -> Optional[DayState]:
+    """Read an employee's attendance state for `day` from the database."""
+    face_db = FaceSession()
     try:
-        payload = body.image.split(",", 1)[1] if "," in body.image else body.image
-        img_bytes = base64.b64decode(payload)
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if frame is None:
-            raise ValueError("Failed to decode image")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+        rec = (
+            face_db.query(Attendance)
+            .filter(
+                Attendance.employee_id == employee_id,
+                Attendance.timestamp >= datetime.combine(day, datetime.min.time()),
+            )
+            .first()
+        )
+        return DayState(rec.check_in, rec.check_out) if rec else None
+    finally:
+        face_db.close()
+
+
+def _no_op_response(entry, action: str, state: Optional[DayState], confidence: Optional[float]):
+    """Response when `action` would not change today's record, else None.
+
+    Raises 400 for a check-out without a check-in.
+    """
+    checked_in = state is not None and state.check_in is not None
+    if action == "check_in":
+        if not checked_in:
+            return None
+        if state.check_out:
+            elapsed = int((state.check_out - state.check_in).total_seconds())
+        else:
+            elapsed = int((datetime.now() - state.check_in).total_seconds())
+        message = "Already checked in today"
+    else:  # check_out
+        if not checked_in:
+            raise HTTPException(status_code=400, detail="You must check in first before checking out")
+        if not state.check_out:
+            return None
+        elapsed = int((state.check_out - state.check_in).total_seconds())
+        message = "Already checked out today"
+
+    return {
+        "message": message,
+        "employee_id": entry.id,
+        "employee_name": entry.name,
+        "confidence": round(confidence, 2) if confidence is not None else None,
+        "checkInTime": state.check_in.isoformat(),
+        "checkOutTime": state.check_out.isoformat() if state.check_out else None,
+        "elapsedSeconds": elapsed,
+        "timestamp": state.check_in.isoformat(),
+    }
+
+
+def _verify_and_record(user, action: str, face, img_bytes: bytes):
+    # 1:1 verification against the caller's own samples plus an impostor cohort
+    gallery = get_gallery()
+    claimed = gallery.employee_for_user(user["id"])
+    if claimed is None:
+        raise HTTPException(status_code=404, detail="No face registered for current user")
+
+    is_match, conf, impostor = gallery.verify(
+        face.encoding, claimed.id, tolerance=0.50, cohort_size=Config.VERIFY_COHORT_SIZE
+    )
+    if impostor is not None:
+        raise HTTPException(status_code=403, detail="Face does not match current user")
+    if not is_match:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Face not recognized. Match: {claimed.name}: {conf:.1%}. Try: 1) Better lighting 2) Face camera directly 3) Register more training samples"
+        )
+
+    return _record_attendance(claimed, conf, action, face, img_bytes)
+
+
+@router.post("/kiosk/mark")
+async def kiosk_mark_attendance(body: MarkBody, _=Depends(admin_or_manager)):
+    """Shared kiosk check-in: identify the face against the whole gallery (1:N)."""
+    action = _validate_action(body.action)
+    return await _mark_kiosk(action, _decode_image(body.image))
+
+
+@router.post("/kiosk/mark/upload")
+async def kiosk_mark_attendance_upload(request: Request, _=Depends(admin_or_manager)):
+    """Binary variant of /kiosk/mark: raw JPEG/PNG bytes; parameter action (default check_in)."""
+    img_bytes, params = await _read_upload(request)
+    action = _validate_action(params.get("action", "check_in"))
+    return await _mark_kiosk(action, img_bytes)
+
+
+async def _mark_kiosk(action: str, img_bytes: bytes):
+    face = await _encode_face(img_bytes)
+    return await _in_threadpool(_identify_and_record, action, face, img_bytes)
+
+
+def _identify_and_record(action: str, face, img_bytes: bytes):
+    # Match against the in-memory gallery (no DB reads or unpickling)
+    gallery = get_gallery()
+    if not len(gallery):
+        raise HTTPException(status_code=404, detail="No employees registered")
+    best_match, best_conf, scores = gallery.identify(face.encoding, tolerance=0.50)  # 50% confidence
+
+    if not best_match:
+        all_matches = [f"{entry.name}: {conf:.1%} ({count} samples)" for entry, conf, count in scores]
+        matches_info = ", ".join(all_matches[:3]) if all_matches else "No faces to compare"
+        raise HTTPException(
+            status_code=404, 
+            detail=f"Face not recognized. Top matches: {matches_info}. Try: 1) Better lighting 2) Face camera directly 3) Register more training samples"
+        )
+
+    return _record_attendance(best_match, best_conf, action, face, img_bytes)
+
+
+@router.post("/kiosk/mark/group")
+async def kiosk_group_mark_attendance(body: MarkBody, _=Depends(admin_or_manager)):
+    """Group kiosk check-in: identify every face in one frame and record each confident match."""
+    action = _validate_action(body.action)
+    return await _mark_kiosk_group(action, _decode_image(body.image))
+
+
+@router.post("/kiosk/mark/group/upload")
+async def kiosk_group_mark_attendance_upload(request: Request, _=Depends(admin_or_manager)):
+    """Binary variant of /kiosk/mark/group: raw JPEG/PNG bytes; parameter action (default check_in)."""
+    img_bytes, params = await _read_upload(request)
+    action = _validate_action(params.get("action", "check_in"))
+    return await _mark_kiosk_group(action, img_bytes)
+
+
+async def _mark_kiosk_group(action: str, img_bytes: bytes):
+    try:
+        group = await face_worker_pool.run(encode_image_faces, img_bytes, Config.KIOSK_GROUP_MAX_FACES)
+    except FaceWorkersBusy:
+        raise HTTPException(status_code=503, detail="Face recognition is busy, please try again in a moment")
+    if group.error:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {group.error}")
+    if group.issues:
+        raise HTTPException(status_code=400, detail={"message": "Face quality issues", "issues": group.issues})
+    return await _in_threadpool(_identify_and_record_group, action, group, img_bytes)
+
+
+def _identify_and_record_group(action: str, group, img_bytes: bytes):
+    """Match every encoded face one-to-one against the gallery and record all matches in one transaction.
 
-    # Encoding
-    result = get_face_encoding(frame)
-    if result is None:
-        raise HTTPException(status_code=400, detail="No face detected")
-    encoding, quality_issues = result
-    if quality_issues:
-        raise HTTPException(status_code=400, detail={"message": "Face quality issues", "issues": quality_issues})
+    Group captures are not used for auto-train (faces are smaller and often off-axis).
+    """
+    gallery = get_gallery()
+    if not len(gallery):
+        raise HTTPException(status_code=404, detail="No employees registered")
+
+    results = []
+    for face in group.faces:
+        x, y, w, h = face.face_box
+        result = {"box": {"x": x, "y": y, "w": w, "h": h}}
+        if face.issues:
+            result.update(status="rejected", issues=face.issues)
+        results.append(result)
+    encoded = [i for i, face in enumerate(group.faces) if face.encoding is not None]
+    matches = gallery.identify_many([group.faces[i].encoding for i in encoded], tolerance=0.50)
+
+    matched = []
+    for index, (entry, conf) in zip(encoded, matches):
+        if entry is None:
+            results[index].update(status="not_recognized", confidence=round(conf, 2))
+        else:
+            matched.append((index, entry, conf))
 
+    recorded = []
     face_db = FaceSession()
     try:
-        employees = face_db.query(Employee).all()
-        if not employees:
-            raise HTTPException(status_code=404, detail="No employees registered")
+        today_start = datetime.combine(date.today(), datetime.min.time())
+        existing = {
+            rec.employee_id: rec
+            for rec in face_db.query(Attendance).filter(
+                Attendance.employee_id.in_([entry.id for _, entry, _ in matched]),
+                Attendance.timestamp >= today_start,
+            )
+        } if matched else {}
 
-        best_match = None
-        best_conf = 0.0
-        all_matches = []  # For debugging
-        
-        for emp in employees:
-            # Collect all encodings for this employee (primary + samples)
-            encodings = [bytes_to_encoding(emp.face_encoding)]
-            
-            # Add additional training samples
-            samples = face_db.query(FaceSample).filter(
-                FaceSample.employee_id == emp.id
-            ).all()
-            for sample in samples:
-                encodings.append(bytes_to_encoding(sample.face_encoding))
-            
-            # Compare against all encodings (uses best match)
-            is_match, conf = compare_faces_multi(encodings, encoding, tolerance=0.50)  # 50% confidence
-            all_matches.append(f"{emp.name}: {conf:.1%} ({len(encodings)} samples)")
-            
-            if is_match and conf > best_conf:
-                best_match = emp
-                best_conf = conf
-
-        if not best_match:
-            matches_info = ", ".join(all_matches[:3]) if all_matches else "No faces to compare"
-            raise HTTPException(
-                status_code=404, 
-                detail=f"Face not recognized. Top matches: {matches_info}. Try: 1) Better lighting 2) Face camera directly 3) Register more training samples"
+        now = datetime.now()
+        for index, entry, conf in matched:
+            rec = existing.get(entry.id)
+            try:
+                no_op = _no_op_response(entry, action, DayState(rec.check_in, rec.check_out) if rec else None, conf)
+            except HTTPException as e:
+                results[index].update(status="rejected", employee_id=entry.id, employee_name=entry.name,
+                                      confidence=round(conf, 2), message=e.detail)
+                continue
+            if no_op is not None:
+                results[index].update(status="unchanged", **no_op)
+                continue
+
+            image_path = image_writer.path_for(entry.id, action, now, img_bytes)
+            if action == "check_in":
+                if rec:
+                    rec.check_in = now
+                    rec.check_in_image = image_path
+                    rec.confidence = float(conf)
+                else:
+                    rec = Attendance(
+                        employee_id=entry.id,
+                        employee_name=entry.name,
+                        timestamp=now,
+                        check_in=now,
+                        check_in_image=image_path,
+                        image_path=image_path,
+                        confidence=float(conf),
+                    )
+                    face_db.add(rec)
+                message = "Checked in successfully"
+            else:  # check_out (an existing check-in is guaranteed by _no_op_response)
+                rec.check_out = now
+                rec.check_out_image = image_path
+                rec.check_out_confidence = float(conf)
+                message = "Checked out successfully"
+            results[index].update(
+                status="recorded",
+                message=message,
+                employee_id=entry.id,
+                employee_name=entry.name,
+                confidence=round(conf, 2),
+                checkInTime=rec.check_in.isoformat(),
+                checkOutTime=rec.check_out.isoformat() if rec.check_out else None,
+                elapsedSeconds=int(((rec.check_out or now) - rec.check_in).total_seconds()),
             )
+            recorded.append((entry.id, image_path, group.faces[index]))
+        # One transaction for the whole group
+        face_db.commit()
+    finally:
+        face_db.close()
 
-        # Verify recognized identity is the current user
-        if best_match.user_id != str(user["id"]):
-            raise HTTPException(status_code=403, detail="Face does not match current user")
+    attendance_state = get_attendance_state()
+    for employee_id, image_path, face in recorded:
+        attendance_state.invalidate(employee_id)
+        _save_images(image_path, face, img_bytes)
 
-        # Auto-train: Add successful captures as training samples (with quality threshold)
-        # Only add if confidence is good and we don't have too many samples already
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        quality_score = float(cv2.Laplacian(gray, cv2.CV_64F).var() / 1000.0)
-        
-        sample_count = face_db.query(FaceSample).filter(
-            FaceSample.employee_id == best_match.id
-        ).count()
-        
-        # Add to training if: high confidence (>70%), good quality (>50), and <20 samples
-        if best_conf > 0.70 and quality_score > 0.05 and sample_count < 20:
-            try:
-                new_sample = FaceSample(
-                    employee_id=best_match.id,
-                    face_encoding=encoding_to_bytes(encoding),
-                    quality_score=quality_score
-                )
-                face_db.add(new_sample)
-                face_db.commit()
-            except Exception:
-                # Silently fail - training is optional
-                pass
+    return {
+        "message": f"Recorded {len(recorded)} of {len(group.faces)} faces",
+        "action": action,
+        "recorded": len(recorded),
+        "faces": results,
+    }
+
+
+BATCH_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def _zip_images(data: bytes, budget: int):
+    """(name, bytes) for every image member of a zip archive, at most budget bytes in total.
 
+    Blocking (decompression); call it through _in_threadpool.
+    """
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            members = [
+                info for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith(BATCH_IMAGE_EXTENSIONS)
+            ]
+            if len(members) > Config.BATCH_MAX_IMAGES:
+                raise HTTPException(status_code=413, detail=f"At most {Config.BATCH_MAX_IMAGES} images per batch")
+            # Checked before decompressing, so an archive cannot expand without bound
+            if any(info.file_size > Config.BATCH_MAX_IMAGE_BYTES for info in members):
+                raise HTTPException(status_code=413, detail="Image in archive is too large")
+            if sum(info.file_size for info in members) > budget:
+                raise HTTPException(status_code=413, detail="Batch upload is too large")
+            # Images barely compress; a high ratio means a zip bomb
+            if any(info.file_size > Config.BATCH_MAX_COMPRESSION_RATIO * max(info.compress_size, 1)
+                   for info in members):
+                raise HTTPException(status_code=413, detail="Archive compression ratio is too high")
+            images = []
+            for info in members:
+                # The declared sizes above come from the archive itself; never read past them
+                with archive.open(info) as member:
+                    image = member.read(info.file_size + 1)
+                if len(image) > info.file_size:
+                    raise HTTPException(status_code=400, detail="Invalid zip archive")
+                images.append((info.filename, image))
+            return images
+    except (zipfile.BadZipFile, zlib.error, EOFError):
+        raise HTTPException(status_code=400, detail="Invalid zip archive")
+
+
+async def _read_batch(request: Request):
+    """(name, image bytes) items and parameters from a batch upload.
+
+    multipart/form-data: every file field is an image, except .zip files,
+    whose image members are expanded; other fields are parameters. Any other
+    content type: the body is a zip archive and parameters come from the
+    query string. The whole upload is held in memory, up to
+    BATCH_MAX_TOTAL_BYTES of images.
+    """
+    params = dict(request.query_params)
+    items = []
+    budget = Config.BATCH_MAX_TOTAL_BYTES
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form(max_files=Config.BATCH_MAX_IMAGES)
+        for key, value in form.multi_items():
+            if isinstance(value, str):
+                params[key] = value
+                continue
+            data = await value.read()
+            name = value.filename or key
+            if name.lower().endswith(".zip"):
+                images = await _in_threadpool(_zip_images, data, budget)
+            else:
+                images = [(name, data)]
+            budget -= sum(len(image) for _, image in images)
+            if budget < 0:
+                raise HTTPException(status_code=413, detail="Batch upload is too large")
+            items.extend(images)
+    else:
+        items = await _in_threadpool(_zip_images, await request.body(), budget)
+    if not items:
+        raise HTTPException(status_code=400, detail="No images in upload")
+    if len(items) > Config.BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=413, detail=f"At most {Config.BATCH_MAX_IMAGES} images per batch")
+    return items, params
+
+
+@router.post("/recognize/batch")
+async def recognize_batch(request: Request, _=Depends(admin_or_manager)):
+    """Identify the face in each of many images (turnstile snapshots, recorded sessions).
+
+    Upload: multipart image files and/or .zip archives, or a raw zip body,
+    read in full before processing starts (see _read_batch for the limits).
+    Parameter top_k (default 3). The response is NDJSON, one line per image
+    as it finishes ({"index", "name", "matches": [...]} or "error"/"issues"),
+    then a {"done": true} summary line. Nothing is recorded.
+    """
+    items, params = await _read_batch(request)
+    try:
+        top_k = max(1, int(params.get("top_k", 3)))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="top_k must be an integer")
+    return StreamingResponse(_recognize_stream(items, top_k), media_type="application/x-ndjson")
+
+
+async def _recognize_stream(items, top_k: int):
+    """Encode items in parallel on the face worker pool and yield one NDJSON line per item."""
+    concurrency = Config.BATCH_CONCURRENCY or 2 * max(1, face_worker_pool.workers)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def encode(index: int, name: str, data: bytes):
+        async with semaphore:
+            delay = 0.05
+            crashes = 0
+            while True:
+                try:
+                    return index, name, await _run_face_pipeline(data)
+                except FaceWorkersRestarting:
+                    # Every call in flight fails when one worker dies; retry once, but an
+                    # image that kills the worker again is reported instead of looping
+                    crashes += 1
+                    if crashes > 1:
+                        logger.error(f"Batch image {name} crashed a face worker")
+                        return index, name, FaceResult(None, [], None, 0.0, "Face recognition failed", None)
+                except FaceWorkersBusy:
+                    # The pool is shared with live check-ins; wait for room instead of failing the item
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 1.0)
+                except Exception:
+                    logger.exception(f"Batch recognition failed for {name}")
+                    return index, name, FaceResult(None, [], None, 0.0, "Face recognition failed", None)
+
+    # The first call loads the gallery from the database
+    gallery = await _in_threadpool(get_gallery)
+    pending = {asyncio.ensure_future(encode(index, name, data)) for index, (name, data) in enumerate(items)}
+    recognized = 0
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            finished = sorted((task.result() for task in done), key=lambda item: item[0])
+            probes = [face.encoding for _, _, face in finished if not face.error and not face.issues]
+            # Everything that finished together is scored against the gallery in one matrix product
+            ranked = iter(await _in_threadpool(gallery.top_matches, probes, top_k, 0.50) if probes else [])
+            for index, name, face in finished:
+                line = {"index": index, "name": name}
+                if face.error:
+                    line["error"] = face.error
+                elif face.issues:
+                    line["issues"] = face.issues
+                else:
+                    x, y, w, h = face.face_box
+                    matches = next(ranked)
+                    recognized += bool(matches and matches[0][2])
+                    line["box"] = {"x": x, "y": y, "w": w, "h": h}
+                    line["matches"] = [
+                        {
+                            "employee_id": entry.id,
+                            "employee_name": entry.name,
+                            "user_id": entry.user_id,
+                            "confidence": round(conf, 4),
+                            "match": passed,
+                        }
+                        for entry, conf, passed in matches
+                    ]
+                yield json.dumps(line) + "\n"
+        yield json.dumps({"done": True, "count": len(items), "recognized": recognized}) + "\n"
+    finally:
+        # Client went away mid-stream
+        for task in pending:
+            task.cancel()
+
+
+def _save_images(image_path: str, face, img_bytes: bytes):
+    """Queue the uploaded image (as received, no re-encode) and its face thumbnail for writing."""
+    if face.replayed:
+        # Real captures are never byte-identical; keep a trail for review
+        logger.warning(f"Attendance recorded from a replayed image: {image_path}")
+    image_writer.submit(image_path, img_bytes)
+    if face.thumbnail is not None:
+        image_writer.submit(image_writer.thumbnail_path(image_path), face.thumbnail)
+
+
+def _record_attendance(best_match, best_conf: float, action: str, face, img_bytes: bytes):
+    """Apply a recognized check-in/check-out for an employee and build the response."""
+    encoding = face.encoding
+    gallery = get_gallery()
+
+    # Nothing to record (and no training sample to add) for a repeated request
+    no_op = _no_op_response(best_match, action, get_attendance_state().get(best_match.id, _load_day_state), best_conf)
+    if no_op is not None:
+        return no_op
+
+    face_db = FaceSession()
+    try:
         # Check for existing record today
         today = date.today()
         existing = (
@@ -294,33 +814,42 @@ def mark_attendance(body: MarkBody, user=Depends(get_current_user)):
             .first()
         )
         
-        # Save image
-        os.makedirs(Config.UPLOAD_DIR, exist_ok=True)
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        image_filename = f"{best_match.id}_{action}_{ts}.jpg"
-        image_path = os.path.join(Config.UPLOAD_DIR, image_filename)
-        cv2.imwrite(image_path, frame)
+        # The database is authoritative (the cached state may be stale)
+        no_op = _no_op_response(
+            best_match, action, DayState(existing.check_in, existing.check_out) if existing else None, best_conf
+        )
+        if no_op is not None:
+            return no_op
         
+        # Auto-train: keep confident, sharp captures that add variety to the employee's samples
+        quality_score = face.quality_score
+        if (best_conf > Config.AUTO_TRAIN_MIN_CONFIDENCE and quality_score > Config.AUTO_TRAIN_MIN_QUALITY
+                and not face.replayed):
+            try:
+                plan, replaced_id = gallery.plan_sample(best_match.id, encoding, quality_score)
+                if plan != "skip":
+                    new_sample = FaceSample(
+                        employee_id=best_match.id,
+                        face_encoding=encoding_to_bytes(encoding),
+                        quality_score=quality_score
+                    )
+                    if plan == "replace":
+                        face_db.query(FaceSample).filter(FaceSample.id == replaced_id).delete()
+                    face_db.add(new_sample)
+                    face_db.commit()
+                    if plan == "replace":
+                        gallery.replace_sample(best_match.id, replaced_id, new_sample.id, encoding, quality_score)
+                    else:
+                        gallery.add_sample(best_match.id, new_sample.id, encoding, quality_score)
+            except Exception:
+                # Silently fail - training is optional
+                face_db.rollback()
+
         now = datetime.now()
+        attendance_state = get_attendance_state()
         
         if action == "check_in":
-            if existing and existing.check_in:
-                elapsed = None
-                if existing.check_out:
-                    elapsed = int((existing.check_out - existing.check_in).total_seconds())
-                else:
-                    elapsed = int((now - existing.check_in).total_seconds())
-                return {
-                    "message": "Already checked in today",
-                    "employee_id": best_match.id,
-                    "employee_name": best_match.name,
-                    "confidence": round(best_conf, 2),
-                    "checkInTime": existing.check_in.isoformat(),
-                    "checkOutTime": existing.check_out.isoformat() if existing.check_out else None,
-                    "elapsedSeconds": elapsed,
-                    "timestamp": existing.check_in.isoformat(),
-                }
-            
+            image_path = image_writer.path_for(best_match.id, action, now, img_bytes)
             if existing:
                 # Update existing record
                 existing.check_in = now
@@ -341,6 +870,8 @@ def mark_attendance(body: MarkBody, user=Depends(get_current_user)):
                 )
                 face_db.add(rec)
                 face_db.commit()
+            attendance_state.invalidate(best_match.id)
+            _save_images(image_path, face, img_bytes)
 
             return {
                 "message": "Checked in successfully",
@@ -351,29 +882,17 @@ def mark_attendance(body: MarkBody, user=Depends(get_current_user)):
                 "checkOutTime": None,
                 "elapsedSeconds": 0,
                 "timestamp": now.isoformat(),
+                "replayed": face.replayed,
             }
         
-        else:  # check_out
-            if not existing or not existing.check_in:
-                raise HTTPException(status_code=400, detail="You must check in first before checking out")
-            
-            if existing.check_out:
-                elapsed = int((existing.check_out - existing.check_in).total_seconds())
-                return {
-                    "message": "Already checked out today",
-                    "employee_id": best_match.id,
-                    "employee_name": best_match.name,
-                    "confidence": round(best_conf, 2),
-                    "checkInTime": existing.check_in.isoformat(),
-                    "checkOutTime": existing.check_out.isoformat(),
-                    "elapsedSeconds": elapsed,
-                    "timestamp": existing.check_in.isoformat(),
-                }
-            
+        else:  # check_out (an existing check-in is guaranteed by _no_op_response)
+            image_path = image_writer.path_for(best_match.id, action, now, img_bytes)
             existing.check_out = now
             existing.check_out_image = image_path
             existing.check_out_confidence = float(best_conf)
             face_db.commit()
+            attendance_state.invalidate(best_match.id)
+            _save_images(image_path, face, img_bytes)
             
             elapsed = int((now - existing.check_in).total_seconds())
             
@@ -386,6 +905,7 @@ def mark_attendance(body: MarkBody, user=Depends(get_current_user)):
                 "checkOutTime": now.isoformat(),
                 "elapsedSeconds": elapsed,
                 "timestamp": existing.check_in.isoformat(),
+                "replayed": face.replayed,
             }
     finally:
         face_db.close()
@@ -767,6 +1287,7 @@ def bulk_add_attendance(
                     if check_out_dt:
                         existing.check_out = check_out_dt
                     face_db.commit()
+                    get_attendance_state().invalidate(emp.id)
                     results["success"].append({
                         "user_id": item.user_id,
                         "date": item.date,
@@ -786,6 +1307,7 @@ def bulk_add_attendance(
                     face_db.add(new_rec)
                     face_db.commit()
                     face_db.refresh(new_rec)
+                    get_attendance_state().invalidate(emp.id)
                     results["success"].append({
                         "user_id": item.user_id,
                         "date": item.date,
@@ -821,16 +1343,19 @@ def bulk_delete_attendance(
     try:
         deleted_count = 0
         not_found = []
+        affected_employees = set()
         
         for record_id in record_ids:
             record = face_db.query(Attendance).filter(Attendance.id == record_id).first()
             if record:
+                affected_employees.add(record.employee_id)
                 face_db.delete(record)
                 deleted_count += 1
             else:
                 not_found.append(record_id)
         
         face_db.commit()
+        get_attendance_state().invalidate(affected_employees)
         
         return {
             "message": f"Deleted {deleted_count} records",
@@ -0,0 +1,100 @@
+"""In-memory cache of each employee's attendance state for today
+
+Lets /attendance/mark answer idempotent requests ("Already checked in",
+"Already checked out", "check in first") without running the face
+pipeline. The database stays authoritative: every attendance write
+invalidates the affected employees, the whole cache resets when the date
+changes, and entries expire after `ttl` seconds so writes made by other
+server processes are picked up.
+"""
+import threading
+import time
+from collections import namedtuple
+from datetime import date
+
+from config import Config
+
+# check_in/check_out are datetimes or None; a missing record is cached as None
+DayState = namedtuple("DayState", ["check_in", "check_out"])
+
+
+class AttendanceStateCache:
+    """Per-employee DayState for the current date
+
+    Args:
+        ttl: Seconds an entry is trusted before it is reloaded
+    """
+
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._day = date.today()
+        self._states = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _roll_day(self):
+        # Lock must be held
+        today = date.today()
+        if today != self._day:
+            self._day = today
+            self._states.clear()
+            self._generation += 1
+
+    def get(self, employee_id, loader):
+        """Today's DayState (or None) for an employee
+
+        Args:
+            loader: Called as loader(employee_id, day) on a miss; reads the database
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._roll_day()
+            cached = self._states.get(employee_id)
+            if cached is not None and now - cached[1] < self.ttl:
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+            day, generation = self._day, self._generation
+
+        state = loader(employee_id, day)
+        with self._lock:
+            # Skip storing if an invalidation or day change happened during the load
+            if self._generation == generation:
+                self._states[employee_id] = (state, now)
+        return state
+
+    def invalidate(self, employee_ids=None):
+        """Forget the given employees (an id or iterable of ids), or everyone"""
+        with self._lock:
+            self._generation += 1
+            if employee_ids is None:
+                self._states.clear()
+            elif isinstance(employee_ids, int):
+                self._states.pop(employee_ids, None)
+            else:
+                for employee_id in employee_ids:
+                    self._states.pop(employee_id, None)
+
+    def stats(self):
+        return {
+            "day": self._day.isoformat(),
+            "entries": len(self._states),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_attendance_state():
+    """Process-wide AttendanceStateCache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AttendanceStateCache(Config.ATTENDANCE_STATE_TTL)
+    return _cache
@@ -0,0 +1,87 @@
+"""
+Benchmark the IVF gallery index against exact search
+Reports recall@1 (ANN top match == exact top match) and mean identify()
+latency for several probe counts on a synthetic gallery. Identities are
+packed closely (centre spread 0.3 by default) so that neighbouring IVF lists
+share employees and recall drops when too few lists are probed.
+
+Usage: python benchmark_ann.py [employees] [samples_per_employee] [probes] [spread]
+"""
+import sys
+import time
+
+import numpy as np
+
+from config import Config
+from face_gallery import FaceGallery, GalleryEntry, PRIMARY_SAMPLE_ID
+
+DIM = 272
+
+
+def make_gallery_arrays(employees, samples, rng, spread=1.0, noise=0.08):
+    """Employee centres with noisy samples, shaped like real encodings (non-negative)
+
+    Centres are uniform in a cube of side `spread` around 0.5 and samples add
+    Gaussian noise of sd `noise`; with spread near noise * 4 identities overlap,
+    as real faces do, instead of sitting far apart.
+    """
+    centres = (0.5 + spread * (rng.random((employees, DIM)) - 0.5)).astype(np.float32)
+    rows = np.repeat(centres, samples, axis=0)
+    rows += rng.normal(0, noise, rows.shape).astype(np.float32)
+    np.clip(rows, 0, None, out=rows)
+    owners = np.repeat(np.arange(1, employees + 1), samples)
+    sample_ids = np.tile(np.arange(samples), employees)
+    sample_ids[::samples] = PRIMARY_SAMPLE_ID
+    entries = {i: GalleryEntry(i, f"employee{i}", str(i)) for i in range(1, employees + 1)}
+    return centres, rows, owners, sample_ids, entries
+
+
+def time_identify(gallery, probes):
+    results = []
+    start = time.perf_counter()
+    for probe in probes:
+        best, _, _ = gallery.identify(probe)
+        results.append(best.id if best else None)
+    elapsed = (time.perf_counter() - start) / len(probes)
+    return results, elapsed * 1000.0
+
+
+def main():
+    employees = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    n_probes = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    spread = float(sys.argv[4]) if len(sys.argv) > 4 else 0.3
+
+    rng = np.random.default_rng(0)
+    centres, rows, owners, sample_ids, entries = make_gallery_arrays(employees, samples, rng, spread)
+    truth = rng.integers(0, employees, n_probes)
+    probes = centres[truth] + rng.normal(0, 0.08, (n_probes, DIM)).astype(np.float32)
+
+    print("=" * 60)
+    print(f"Gallery: {employees} employees x {samples} samples = {len(rows)} rows, "
+          f"{n_probes} probes, centre spread {spread}")
+    print("=" * 60)
+
+    Config.ANN_ENABLED = False
+    exact = FaceGallery()
+    exact.load_arrays(rows, owners, sample_ids, entries)
+    exact_ids, exact_ms = time_identify(exact, probes)
+    print(f"{'exact':>12}  recall@1 1.000  {exact_ms:8.2f} ms/probe")
+
+    Config.ANN_ENABLED = True
+    Config.ANN_MIN_ROWS = 0
+    start = time.perf_counter()
+    approx = FaceGallery()
+    approx.load_arrays(rows, owners, sample_ids, entries)
+    print(f"IVF build: {len(approx.ann.lists)} lists in {time.perf_counter() - start:.2f}s")
+
+    for n_probe in (1, 2, 4, 8, 16, 32):
+        approx.ann.n_probe = n_probe
+        ann_ids, ann_ms = time_identify(approx, probes)
+        recall = np.mean([a == e for a, e in zip(ann_ids, exact_ids)])
+        print(f"{'nprobe=' + str(n_probe):>12}  recall@1 {recall:.3f}  {ann_ms:8.2f} ms/probe  "
+              f"({exact_ms / ann_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark the face detector backends on a local image set
+Every available backend (model files present in FACE_MODEL_DIR) runs over
+the same decoded frames. Reports the share of images with exactly one face
+(what check-in needs), with any face, and detection latency, so the fastest
+backend that meets the accuracy bar can be set as FACE_DETECTOR.
+
+Images should each show one person, like check-in captures. Without a
+directory, synthetic faces are used (a smoke test, not an accuracy measure).
+
+Usage: python benchmark_detectors.py [image_dir] [repeats]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+from face_detectors import available_backends, backend_names, get_backend
+from face_utils import FrameContext, decode_frame
+from synthetic_faces import draw_face
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def load_frames(root):
+    """Working-resolution frames for every image under root, as the API decodes them"""
+    frames = []
+    for directory, _, files in os.walk(root):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(directory, name), "rb") as f:
+                    frame = decode_frame(f.read())
+                if frame is not None:
+                    frames.append(frame)
+    return frames
+
+
+def synthetic_frames(count=20):
+    return [draw_face(seed) for seed in range(count)]
+
+
+def benchmark(backend, frames, repeats):
+    """(single-face rate, any-face rate, mean ms, p95 ms) for one backend"""
+    detector = backend()
+    detector.detect(frames[0], FrameContext(frames[0]))  # First call allocates buffers
+    counts = []
+    timings = []
+    for _ in range(repeats):
+        for frame in frames:
+            context = FrameContext(frame)
+            started = time.perf_counter()
+            faces = detector.detect(frame, context)
+            timings.append((time.perf_counter() - started) * 1000.0)
+            counts.append(len(faces))
+    counts = np.asarray(counts)
+    return (np.mean(counts == 1), np.mean(counts > 0), float(np.mean(timings)),
+            float(np.percentile(timings, 95)))
+
+
+def main():
+    args = sys.argv[1:]
+    image_dir = args.pop(0) if args and os.path.isdir(args[0]) else None
+    repeats = int(args[0]) if args else 3
+
+    frames = load_frames(image_dir) if image_dir else synthetic_frames()
+    if not frames:
+        print(f"✗ No readable images in {image_dir}")
+        return
+
+    available = available_backends()
+    print("=" * 72)
+    print(f"{len(frames)} images{' (synthetic)' if not image_dir else ''}, {repeats} passes")
+    print("=" * 72)
+    print(f"{'backend':>8}  {'one face':>8}  {'any face':>8}  {'mean ms':>8}  {'p95 ms':>8}")
+    for name in backend_names():
+        if name not in available:
+            print(f"{name:>8}  model files not found")
+            continue
+        single, detected, mean_ms, p95_ms = benchmark(get_backend(name), frames, repeats)
+        print(f"{name:>8}  {single:8.3f}  {detected:8.3f}  {mean_ms:8.2f}  {p95_ms:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark cold-start import time of the FastAPI app (app.main)
+Each run imports app.main in a fresh interpreter with -X importtime and
+reports the total plus the face-related modules, then times the first
+face_utils.warm_up() call that now carries the model loading.
+
+Runs in a temporary directory so the SQLite files and uploads/ created on
+import do not touch the real ones.
+
+Usage: python benchmark_import.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_ROOT = os.path.dirname(os.path.abspath(__file__))
+MODULES = ("app.main", "app.routers.attendance", "face_utils", "cv2", "flask")
+
+IMPORT_SCRIPT = "import app.main"
+WARM_UP_SCRIPT = """
+import time
+import face_utils
+start = time.perf_counter()
+face_utils.warm_up()
+print((time.perf_counter() - start) * 1000.0)
+"""
+
+
+def run_python(code, cwd, importtime=False):
+    env = dict(os.environ, PYTHONPATH=BACKEND_ROOT, FACE_MODEL_DIR=os.environ.get("FACE_MODEL_DIR", BACKEND_ROOT))
+    args = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    return subprocess.run(args, cwd=cwd, env=env, capture_output=True, text=True, check=True)
+
+
+def parse_importtime(stderr):
+    """Cumulative import time in ms for each module of interest"""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        name = name.strip()
+        if name in MODULES and name not in times:
+            try:
+                times[name] = int(cumulative) / 1000.0
+            except ValueError:
+                pass
+    return times
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    samples = {name: [] for name in MODULES}
+    warm_up = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as work:
+            times = parse_importtime(run_python(IMPORT_SCRIPT, work, importtime=True).stderr)
+            for name, ms in times.items():
+                samples[name].append(ms)
+            warm_up.append(float(run_python(WARM_UP_SCRIPT, work).stdout.strip().splitlines()[-1]))
+
+    print("=" * 60)
+    print(f"Cold import of app.main, median of {runs} runs")
+    print("=" * 60)
+    for name in MODULES:
+        if samples[name]:
+            print(f"{name:>24}  {statistics.median(samples[name]):8.1f} ms")
+        else:
+            print(f"{name:>24}  (not imported)")
+    print(f"{'face_utils.warm_up()':>24}  {statistics.median(warm_up):8.1f} ms  (first face request)")
+
+
+if __name__ == "__main__":
+    main()
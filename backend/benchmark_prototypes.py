@@ -0,0 +1,90 @@
+"""
+Benchmark prototype-compressed matching against the full gallery
+Builds prototype sets for a synthetic gallery, then reports agreement with
+full-gallery identify() (same employee or same rejection) and mean latency
+for several rescore limits, at the production tolerance by default.
+
+Usage: python benchmark_prototypes.py [employees] [samples_per_employee] [probes] [tolerance]
+"""
+import sys
+import time
+
+import numpy as np
+
+from benchmark_ann import DIM, make_gallery_arrays
+from config import Config
+from face_gallery import FaceGallery
+from face_prototypes import select_prototypes
+
+
+def build_prototypes(rows, owners, sample_ids):
+    """employee id -> (kept sample ids, max sample id), as build_prototypes.py stores them"""
+    prototypes = {}
+    for employee_id in np.unique(owners):
+        own = np.flatnonzero(owners == employee_id)
+        medoids, outliers = select_prototypes(
+            rows[own],
+            k=Config.PROTOTYPES_PER_EMPLOYEE,
+            max_outliers=Config.PROTOTYPE_MAX_OUTLIERS,
+            outlier_distance=Config.PROTOTYPE_OUTLIER_DISTANCE,
+        )
+        ids = sample_ids[own]
+        kept = np.concatenate([medoids, outliers])
+        prototypes[int(employee_id)] = (frozenset(int(i) for i in ids[kept]), int(ids.max()))
+    return prototypes
+
+
+def time_identify(gallery, probes, tolerance):
+    results = []
+    start = time.perf_counter()
+    for probe in probes:
+        best, _, _ = gallery.identify(probe, tolerance)
+        results.append(best.id if best else None)
+    return results, (time.perf_counter() - start) / len(probes) * 1000.0
+
+
+def main():
+    employees = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    n_probes = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    tolerance = float(sys.argv[4]) if len(sys.argv) > 4 else 0.50  # As the kiosk uses
+
+    rng = np.random.default_rng(0)
+    centres, rows, owners, sample_ids, entries = make_gallery_arrays(employees, samples, rng)
+    # Half the probes are enrolled employees, half are strangers
+    truth = rng.integers(0, employees, n_probes)
+    probes = centres[truth] + rng.normal(0, 0.08, (n_probes, DIM)).astype(np.float32)
+    strangers = rng.random((n_probes // 2, DIM)).astype(np.float32)
+    probes[: len(strangers)] = strangers
+
+    print("=" * 60)
+    print(f"Gallery: {employees} employees x {samples} samples = {len(rows)} rows, "
+          f"{n_probes} probes, tolerance {tolerance}")
+    print("=" * 60)
+
+    Config.ANN_ENABLED = False
+    full = FaceGallery()
+    full.load_arrays(rows, owners, sample_ids, entries)
+    full_ids, full_ms = time_identify(full, probes, tolerance)
+    print(f"{'full':>12}  agreement 1.000  {full_ms:8.2f} ms/probe")
+
+    start = time.perf_counter()
+    prototypes = build_prototypes(rows, owners, sample_ids)
+    print(f"Prototype build: {time.perf_counter() - start:.2f}s")
+
+    Config.PROTOTYPES_ENABLED = True
+    compact = FaceGallery()
+    compact.load_arrays(rows, owners, sample_ids, entries, prototypes=prototypes)
+    print(f"Rows matched first: {len(compact.compact.owners)} of {len(rows)} "
+          f"({len(rows) / len(compact.compact.owners):.1f}x smaller)")
+
+    for top_k in (5, 10, 25, 50, 100):
+        Config.PROTOTYPE_RESCORE_TOP_K = top_k
+        compact_ids, compact_ms = time_identify(compact, probes, tolerance)
+        agreement = np.mean([a == e for a, e in zip(compact_ids, full_ids)])
+        print(f"{'top_k=' + str(top_k):>12}  agreement {agreement:.3f}  {compact_ms:8.2f} ms/probe  "
+              f"({full_ms / compact_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
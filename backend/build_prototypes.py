@@ -0,0 +1,97 @@
+"""
+Build per-employee prototype sets for gallery compression
+Each employee with at least PROTOTYPE_MIN_SAMPLES encodings (primary plus
+samples) is reduced to PROTOTYPES_PER_EMPLOYEE k-medoids plus up to
+PROTOTYPE_MAX_OUTLIERS outliers. Re-run after large enrolment batches;
+samples added since the last build are matched regardless.
+
+Usage: python build_prototypes.py [--clear]
+"""
+import sys
+from collections import defaultdict
+
+from config import Config
+from database import Session, engine, Base
+from face_gallery import PRIMARY_SAMPLE_ID
+from face_prototypes import select_prototypes
+from face_utils import bytes_to_encoding, is_current_encoding
+from models import Employee, FaceSample, FacePrototype
+
+
+def load_encodings(session):
+    """employee id -> ([sample ids], [encodings]), primary encoding first
+
+    Only encodings from the active face encoder are returned.
+    """
+    encodings = defaultdict(lambda: ([], []))
+    for employee_id, blob in session.query(Employee.id, Employee.face_encoding).filter(
+        Employee.face_encoding.isnot(None)
+    ):
+        if not is_current_encoding(blob):
+            continue
+        ids, rows = encodings[employee_id]
+        ids.append(PRIMARY_SAMPLE_ID)
+        rows.append(bytes_to_encoding(blob))
+    for sample_id, employee_id, blob in session.query(
+        FaceSample.id, FaceSample.employee_id, FaceSample.face_encoding
+    ).order_by(FaceSample.id):
+        if not is_current_encoding(blob):
+            continue
+        ids, rows = encodings[employee_id]
+        ids.append(sample_id)
+        rows.append(bytes_to_encoding(blob))
+    return encodings
+
+
+def build(clear=False):
+    Base.metadata.create_all(bind=engine)
+    session = Session()
+    try:
+        if clear:
+            removed = session.query(FacePrototype).delete()
+            session.commit()
+            print(f"✓ Removed {removed} prototype sets")
+            return
+
+        total_rows = 0
+        kept_rows = 0
+        built = 0
+        for employee_id, (ids, rows) in sorted(load_encodings(session).items()):
+            total_rows += len(ids)
+            if len(ids) < max(Config.PROTOTYPE_MIN_SAMPLES, Config.PROTOTYPES_PER_EMPLOYEE + 1):
+                kept_rows += len(ids)
+                session.query(FacePrototype).filter_by(employee_id=employee_id).delete()
+                continue
+
+            medoids, outliers = select_prototypes(
+                rows,
+                k=Config.PROTOTYPES_PER_EMPLOYEE,
+                max_outliers=Config.PROTOTYPE_MAX_OUTLIERS,
+                outlier_distance=Config.PROTOTYPE_OUTLIER_DISTANCE,
+            )
+            session.merge(FacePrototype(
+                employee_id=employee_id,
+                prototype_ids=",".join(str(ids[i]) for i in medoids),
+                outlier_ids=",".join(str(ids[i]) for i in outliers),
+                max_sample_id=max(ids),
+            ))
+            kept_rows += len(medoids) + len(outliers)
+            built += 1
+        session.commit()
+
+        print(f"✓ Prototype sets built for {built} employees")
+        if kept_rows:
+            print(f"✓ Gallery rows matched first: {kept_rows} of {total_rows} "
+                  f"({total_rows / kept_rows:.1f}x smaller)")
+        print("Reload running servers with POST /attendance/gallery/rebuild")
+
+    except Exception as e:
+        session.rollback()
+        print(f"✗ Prototype build failed: {e}")
+        raise
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    build(clear="--clear" in sys.argv[1:])
@@ -6,14 +6,54 @@ class Config:
     # Database
     DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///face_attendance.db')
     
-    # Upload directory
+    # Upload directory (check-in images go to UPLOAD_DIR/YYYY/MM/DD/<employee_id>/)
     UPLOAD_DIR = os.getenv('UPLOAD_DIR', 'uploads')
+    IMAGE_WRITE_RETRIES = int(os.getenv('IMAGE_WRITE_RETRIES', '5'))
+    # Images that still cannot be written to UPLOAD_DIR wait here and are moved back later
+    IMAGE_SPOOL_DIR = os.getenv('IMAGE_SPOOL_DIR', 'uploads_spool')
+    FACE_THUMBNAIL_SIZE = int(os.getenv('FACE_THUMBNAIL_SIZE', '0'))  # Also save a face crop of this size, 0 = off
     
-    # Face recognition settings
+    # Directory holding the detector model files (see download_models.py, face_detectors.py)
+    FACE_MODEL_DIR = os.getenv('FACE_MODEL_DIR', os.path.dirname(os.path.abspath(__file__)))
+    
+    # Face detector backend: auto, ssd, yunet, tf_ssd or haar (see face_detectors.py);
+    # auto uses ssd when its model files are in FACE_MODEL_DIR, otherwise haar
+    FACE_DETECTOR = os.getenv('FACE_DETECTOR', 'auto')
+    # SSD / TF SSD: network input side and minimum detection confidence
+    FACE_DETECT_INPUT_SIZE = int(os.getenv('FACE_DETECT_INPUT_SIZE', '300'))
+    FACE_DETECT_CONFIDENCE = float(os.getenv('FACE_DETECT_CONFIDENCE', '0.5'))
+    # YuNet: score and non-maximum suppression thresholds
+    YUNET_SCORE_THRESHOLD = float(os.getenv('YUNET_SCORE_THRESHOLD', '0.9'))
+    YUNET_NMS_THRESHOLD = float(os.getenv('YUNET_NMS_THRESHOLD', '0.3'))
+    # Face encoder: handcrafted or sface (see face_encoders.py); falls back to handcrafted
+    # when the SFace model file is missing. Faces must be re-registered after switching.
+    FACE_ENCODER = os.getenv('FACE_ENCODER', 'handcrafted')
+    # SFace cosine similarity that maps to match confidence 0.5
+    SFACE_COSINE_THRESHOLD = float(os.getenv('SFACE_COSINE_THRESHOLD', '0.363'))
+    # Haar cascade: smallest face (working-frame pixels), pyramid step and neighbours
     FACE_MIN_SIZE = int(os.getenv('FACE_MIN_SIZE', '50'))
     FACE_SCALE_FACTOR = float(os.getenv('FACE_SCALE_FACTOR', '1.1'))
     FACE_MIN_NEIGHBORS = int(os.getenv('FACE_MIN_NEIGHBORS', '5'))
     
+    # Working resolution: uploads are decoded with their long side capped at
+    # MAX_FRAME_SIDE, and Haar / YuNet detection runs on a copy capped at DETECT_MAX_SIDE
+    # (0 disables either limit)
+    MAX_FRAME_SIDE = int(os.getenv('MAX_FRAME_SIDE', '1280'))
+    DETECT_MAX_SIDE = int(os.getenv('DETECT_MAX_SIDE', '640'))
+    
+    # Detector instances shared by concurrent requests (one per busy worker thread)
+    DETECTOR_POOL_SIZE = int(os.getenv('DETECTOR_POOL_SIZE', str(os.cpu_count() or 4)))
+    
+    # DNN detection micro-batching across concurrent requests (within one process,
+    # so it pays off with FACE_WORKERS=0 or many threads per worker)
+    DETECT_BATCHING = os.getenv('DETECT_BATCHING', 'False').lower() == 'true'
+    DETECT_BATCH_MAX_SIZE = int(os.getenv('DETECT_BATCH_MAX_SIZE', '8'))
+    DETECT_BATCH_MAX_WAIT_MS = float(os.getenv('DETECT_BATCH_MAX_WAIT_MS', '5'))
+    
+    # Process pool for decode/detect/encode, isolated from the request threadpool
+    FACE_WORKERS = int(os.getenv('FACE_WORKERS', '2'))  # 0 = run inline on the threadpool
+    FACE_QUEUE_MAX = int(os.getenv('FACE_QUEUE_MAX', '32'))  # Waiting requests beyond this get a 503
+    
     # Quality thresholds
     BRIGHTNESS_MIN = int(os.getenv('BRIGHTNESS_MIN', '30'))
     BRIGHTNESS_MAX = int(os.getenv('BRIGHTNESS_MAX', '230'))
@@ -21,6 +61,55 @@ class Config:
     
     # Matching settings
     MATCH_TOLERANCE = float(os.getenv('MATCH_TOLERANCE', '0.4'))
+    # Most similar other employees scored as impostor check during 1:1 verification
+    VERIFY_COHORT_SIZE = int(os.getenv('VERIFY_COHORT_SIZE', '10'))
+    # Group kiosk check-in (/attendance/kiosk/mark/group): largest faces identified per frame
+    KIOSK_GROUP_MAX_FACES = int(os.getenv('KIOSK_GROUP_MAX_FACES', '8'))
+    # Batch recognition (/attendance/recognize/batch): images per request, largest image
+    # accepted from a zip, image bytes per request, largest zip member compression ratio,
+    # and images encoded at once (0 = twice the face workers)
+    BATCH_MAX_IMAGES = int(os.getenv('BATCH_MAX_IMAGES', '500'))
+    BATCH_MAX_IMAGE_BYTES = int(os.getenv('BATCH_MAX_IMAGE_BYTES', str(20 * 1024 * 1024)))
+    BATCH_MAX_TOTAL_BYTES = int(os.getenv('BATCH_MAX_TOTAL_BYTES', str(200 * 1024 * 1024)))
+    BATCH_MAX_COMPRESSION_RATIO = float(os.getenv('BATCH_MAX_COMPRESSION_RATIO', '50'))
+    BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '0'))
+    
+    # Auto-train: confident check-ins become training samples (see FaceGallery.plan_sample)
+    AUTO_TRAIN_MIN_CONFIDENCE = float(os.getenv('AUTO_TRAIN_MIN_CONFIDENCE', '0.70'))
+    AUTO_TRAIN_MIN_QUALITY = float(os.getenv('AUTO_TRAIN_MIN_QUALITY', '0.05'))
+    AUTO_TRAIN_MAX_SAMPLES = int(os.getenv('AUTO_TRAIN_MAX_SAMPLES', '20'))
+    # Captures at least this similar to a stored encoding are skipped as near-duplicates
+    AUTO_TRAIN_DUPLICATE_SIMILARITY = float(os.getenv('AUTO_TRAIN_DUPLICATE_SIMILARITY', '0.97'))
+    
+    # Face pipeline results for byte-identical uploads (retries, replays); size 0 disables
+    ENCODING_CACHE_SIZE = int(os.getenv('ENCODING_CACHE_SIZE', '1024'))
+    ENCODING_CACHE_TTL = float(os.getenv('ENCODING_CACHE_TTL', '300'))
+    
+    # Seconds a cached per-employee attendance state for today is trusted (see attendance_state.py)
+    ATTENDANCE_STATE_TTL = float(os.getenv('ATTENDANCE_STATE_TTL', '60'))
+    
+    # Precision of encodings written to the database and held in the in-memory gallery:
+    # float32 (exact), float16 or int8 (one scale per encoding); see evaluate_precision.py
+    ENCODING_STORAGE = os.getenv('ENCODING_STORAGE', 'float32')
+    GALLERY_PRECISION = os.getenv('GALLERY_PRECISION', 'float32')
+    
+    # Per-employee prototype compression (build_prototypes.py); ignored until prototypes are built
+    PROTOTYPES_ENABLED = os.getenv('PROTOTYPES_ENABLED', 'True').lower() == 'true'
+    PROTOTYPES_PER_EMPLOYEE = int(os.getenv('PROTOTYPES_PER_EMPLOYEE', '3'))
+    PROTOTYPE_MAX_OUTLIERS = int(os.getenv('PROTOTYPE_MAX_OUTLIERS', '1'))
+    PROTOTYPE_OUTLIER_DISTANCE = float(os.getenv('PROTOTYPE_OUTLIER_DISTANCE', '0.1'))
+    PROTOTYPE_MIN_SAMPLES = int(os.getenv('PROTOTYPE_MIN_SAMPLES', '6'))  # Smaller sets are left as-is
+    # Employees within this margin of the threshold and of the best prototype score are
+    # rescored against all their samples, at most PROTOTYPE_RESCORE_TOP_K of them
+    PROTOTYPE_FALLBACK_MARGIN = float(os.getenv('PROTOTYPE_FALLBACK_MARGIN', '0.05'))
+    PROTOTYPE_RESCORE_TOP_K = int(os.getenv('PROTOTYPE_RESCORE_TOP_K', '50'))
+    
+    # Approximate nearest-neighbour (IVF) index for very large galleries
+    ANN_ENABLED = os.getenv('ANN_ENABLED', 'False').lower() == 'true'
+    ANN_MIN_ROWS = int(os.getenv('ANN_MIN_ROWS', '20000'))  # Exact scan below this size
+    ANN_LISTS = int(os.getenv('ANN_LISTS', '0'))  # 0 = ~sqrt(gallery rows)
+    ANN_PROBES = int(os.getenv('ANN_PROBES', '8'))
+    ANN_TOP_K = int(os.getenv('ANN_TOP_K', '50'))
     
     # Server settings
     HOST = os.getenv('FLASK_HOST', '0.0.0.0')
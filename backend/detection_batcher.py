@@ -0,0 +1,121 @@
+"""Micro-batching of DNN face detection across concurrent requests
+
+Concurrent callers hand their 300x300 input blobs to a DetectionBatcher,
+which waits up to `max_wait_ms` (or until `max_batch_size` blobs are
+queued), runs one batched forward pass and scatters the detections back.
+The SSD DetectionOutput layer tags every detection with the index of the
+image it came from, so the batched output splits cleanly per caller.
+"""
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingDetection:
+    __slots__ = ("blob", "enqueued_at", "done", "result", "error")
+
+    def __init__(self, blob):
+        self.blob = blob
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class DetectionBatcher:
+    """Collects detection blobs from many threads and runs them as one batch
+
+    The batcher's worker thread is the only user of `net`, so callers never
+    touch the network object concurrently.
+
+    Args:
+        net: cv2.dnn Net (or anything with setInput/forward) producing SSD output
+        max_batch_size: Most blobs per forward pass
+        max_wait_ms: Longest time the first blob of a batch waits for company
+    """
+
+    def __init__(self, net, max_batch_size=8, max_wait_ms=5.0):
+        self.net = net
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64])
+        self.queue_wait_ms = Histogram([0.5, 1, 2, 5, 10, 25, 50, 100, 250])
+        self.forward_ms = Histogram([5, 10, 25, 50, 100, 250, 500, 1000])
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._start_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name="detection-batcher", daemon=True)
+                    self._worker.start()
+
+    def detect(self, blob):
+        """Run detection for one (1, 3, H, W) blob; blocks until its batch completes
+
+        Returns:
+            Detections shaped like a single-image forward pass: (1, 1, K, 7)
+        """
+        self._ensure_worker()
+        pending = _PendingDetection(blob)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            for pending in batch:
+                self.queue_wait_ms.observe((started - pending.enqueued_at) * 1000.0)
+            self.batch_sizes.observe(len(batch))
+
+            try:
+                self.net.setInput(np.concatenate([pending.blob for pending in batch], axis=0))
+                detections = self.net.forward()
+                self.forward_ms.observe((time.perf_counter() - started) * 1000.0)
+
+                image_ids = detections[0, 0, :, 0].astype(np.int64)
+                for index, pending in enumerate(batch):
+                    pending.result = detections[:, :, image_ids == index, :]
+            except Exception as e:
+                logger.error(f"Batched face detection failed: {e}")
+                for pending in batch:
+                    pending.error = e
+            finally:
+                for pending in batch:
+                    pending.done.set()
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queued": self._queue.qsize(),
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            "forward_ms": self.forward_ms.snapshot(),
+        }
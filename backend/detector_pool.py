@@ -0,0 +1,76 @@
+"""Bounded checkout pool for OpenCV detector objects
+
+cv2.dnn Net and CascadeClassifier instances are not safe to use from
+several threads at once (setInput/forward share internal state), and FastAPI
+runs sync handlers on a threadpool. Each caller checks out its own instance
+for the duration of one detection; instances are created lazily up to the
+pool size, after which callers wait for one to be returned.
+"""
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import Histogram
+
+
+class DetectorPool:
+    """Pool of up to `size` objects built by `factory`
+
+    Args:
+        factory: Zero-argument callable creating one detector instance
+        size: Maximum number of instances alive at once
+        initial: Optional already-built instances to seed the pool with
+    """
+
+    def __init__(self, factory, size, initial=()):
+        self.factory = factory
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self.checkout_wait_ms = Histogram([0.1, 1, 5, 10, 25, 50, 100, 250, 1000])
+        for instance in initial:
+            if self._created < self.size:
+                self._idle.put(instance)
+                self._created += 1
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self.factory()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+    @contextmanager
+    def checkout(self):
+        """Borrow an instance for the duration of a `with` block"""
+        started = time.perf_counter()
+        instance = self._acquire()
+        self.checkout_wait_ms.observe((time.perf_counter() - started) * 1000.0)
+        try:
+            yield instance
+        finally:
+            self._idle.put(instance)
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "created": self._created,
+            "idle": self._idle.qsize(),
+            "checkout_wait_ms": self.checkout_wait_ms.snapshot(),
+        }
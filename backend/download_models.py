@@ -6,11 +6,14 @@ import urllib.request
 import os
 import sys
 
+from config import Config
+
 MODEL_URL = "https://github.com/opencv/opencv_3rdparty/raw/dnn_samples_face_detector_20170830/res10_300x300_ssd_iter_140000.caffemodel"
 CONFIG_URL = "https://raw.githubusercontent.com/opencv/opencv/master/samples/dnn/face_detector/deploy.prototxt"
 
-MODEL_FILE = "res10_300x300_ssd_iter_140000.caffemodel"
-CONFIG_FILE = "deploy.prototxt"
+# Saved where face_utils looks for them (FACE_MODEL_DIR, default: this directory)
+MODEL_FILE = os.path.join(Config.FACE_MODEL_DIR, "res10_300x300_ssd_iter_140000.caffemodel")
+CONFIG_FILE = os.path.join(Config.FACE_MODEL_DIR, "deploy.prototxt")
 
 def download_file(url, filename):
     """Download file with progress"""
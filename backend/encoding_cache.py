@@ -0,0 +1,81 @@
+"""LRU cache of face pipeline results keyed by a hash of the uploaded bytes
+
+Kiosk retries and front-end resubmissions often post byte-identical images.
+A hit skips decode, detection, quality checks and encoding and goes straight
+to matching. Because two real camera captures are never byte-identical, a hit
+also marks the request as a replay of an earlier image.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+
+
+def content_key(data):
+    """Fast 128-bit digest of the encoded image bytes"""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class EncodingCache:
+    """Bounded LRU mapping content keys to FaceResults, with expiry
+
+    Args:
+        max_entries: Most results kept; 0 disables the cache
+        ttl: Seconds a result stays valid
+    """
+
+    def __init__(self, max_entries=1024, ttl=300.0):
+        self.max_entries = max(0, max_entries)
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Cached result for `key`, or None"""
+        if not self.max_entries:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[1] >= self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, result):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (result, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+        }
+
+
+encoding_cache = EncodingCache(Config.ENCODING_CACHE_SIZE, Config.ENCODING_CACHE_TTL)
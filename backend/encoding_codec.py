@@ -0,0 +1,144 @@
+"""Binary codec for stored face encodings
+
+Encodings are stored as a 16-byte header followed by raw little-endian
+values, so they decode with a zero-copy np.frombuffer instead of unpickling.
+One blob may hold several encodings of the same dimension (e.g. all of an
+employee's samples) as a contiguous row-major matrix.
+
+Header layout (little-endian):
+    4s  magic           b"FENC"
+    B   format version  FORMAT_VERSION
+    B   dtype code      see DTYPES
+    H   encoder version version of the encoder that produced the values
+    I   dimension       values per encoding
+    I   count           number of encodings in the blob
+
+Values are float32, float16 or int8. An int8 blob stores one float32 scale
+per encoding (count x 4 bytes) right after the header, followed by the
+quantized values; each encoding is value * scale.
+
+Rows written before this codec existed are pickled numpy arrays; decode()
+still accepts them.
+"""
+import pickle
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+MAGIC = b"FENC"
+FORMAT_VERSION = 1
+
+# Encoder version assumed for legacy pickled rows
+LEGACY_ENCODER_VERSION = 1
+
+_HEADER = struct.Struct("<4sBBHII")
+HEADER_SIZE = _HEADER.size
+
+# dtype code -> numpy dtype of the stored values
+DTYPES = {
+    1: np.dtype("<f4"),
+    2: np.dtype("<f2"),
+    3: np.dtype("<i1"),
+}
+_DTYPE_CODES = {dtype: code for code, dtype in DTYPES.items()}
+
+# Storage precision names accepted by encode()
+PRECISIONS = {"float32": DTYPES[1], "float16": DTYPES[2], "int8": DTYPES[3]}
+_SCALE_DTYPE = np.dtype("<f4")
+
+EncodingHeader = namedtuple("EncodingHeader", ["format_version", "dtype", "encoder_version", "dim", "count"])
+
+
+class EncodingFormatError(ValueError):
+    """Raised when a blob is neither a valid codec blob nor a legacy pickle"""
+
+
+def is_legacy(blob):
+    """True if the blob predates the codec (pickled numpy array)"""
+    return bytes(blob[:len(MAGIC)]) != MAGIC
+
+
+def read_header(blob):
+    """Parse the header of a codec blob"""
+    if len(blob) < HEADER_SIZE or is_legacy(blob):
+        raise EncodingFormatError("Not an encoded face blob")
+    magic, version, dtype_code, encoder_version, dim, count = _HEADER.unpack_from(blob)
+    if version != FORMAT_VERSION:
+        raise EncodingFormatError(f"Unsupported encoding format version {version}")
+    if dtype_code not in DTYPES:
+        raise EncodingFormatError(f"Unsupported encoding dtype code {dtype_code}")
+    return EncodingHeader(version, DTYPES[dtype_code], encoder_version, dim, count)
+
+
+def quantize_int8(matrix):
+    """Symmetric per-row int8 quantization
+
+    Returns:
+        (int8 matrix, float32 scale per row) with row ~= values * scale
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    peaks = np.abs(matrix).max(axis=1) if matrix.size else np.zeros(len(matrix), dtype=np.float32)
+    scales = np.where(peaks > 0, peaks / 127.0, 1.0).astype(np.float32)
+    values = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return values, scales
+
+
+def encode(encodings, encoder_version=LEGACY_ENCODER_VERSION, precision="float32"):
+    """Pack one encoding (1-D) or several (2-D, one per row) into a blob
+
+    Args:
+        precision: "float32", "float16" or "int8" (see PRECISIONS)
+    """
+    values = np.asarray(encodings, dtype=np.float32)
+    if values.ndim == 1:
+        values = values.reshape(1, -1)
+    if values.ndim != 2:
+        raise ValueError("Encodings must be a vector or a 2-D matrix")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown encoding precision '{precision}'")
+
+    dtype = PRECISIONS[precision]
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, _DTYPE_CODES[dtype], encoder_version,
+                          values.shape[1], values.shape[0])
+    if precision == "int8":
+        values, scales = quantize_int8(values)
+        return header + scales.astype(_SCALE_DTYPE).tobytes() + values.tobytes()
+    return header + np.ascontiguousarray(values, dtype=dtype).tobytes()
+
+
+def decode(blob):
+    """Decode a blob into a (count x dim) float32 matrix
+
+    float32 blobs are returned as a read-only view over the blob's memory;
+    float16 and int8 blobs are widened into a new array. Legacy pickled
+    arrays are unpickled and returned as a 1 x dim matrix.
+    """
+    if is_legacy(blob):
+        try:
+            values = pickle.loads(blob)
+        except Exception as e:
+            raise EncodingFormatError(f"Unreadable legacy encoding: {e}")
+        return np.asarray(values, dtype=np.float32).reshape(1, -1)
+
+    header = read_header(blob)
+    quantized = header.dtype == PRECISIONS["int8"]
+    offset = HEADER_SIZE + (header.count * _SCALE_DTYPE.itemsize if quantized else 0)
+    expected = offset + header.dim * header.count * header.dtype.itemsize
+    if len(blob) < expected:
+        raise EncodingFormatError("Truncated encoding blob")
+    values = np.frombuffer(blob, dtype=header.dtype, count=header.dim * header.count, offset=offset)
+    values = values.reshape(header.count, header.dim)
+    if quantized:
+        scales = np.frombuffer(blob, dtype=_SCALE_DTYPE, count=header.count, offset=HEADER_SIZE)
+        return values.astype(np.float32) * scales[:, None]
+    if header.dtype != DTYPES[1]:
+        return values.astype(np.float32)
+    return values
+
+
+def encoder_version(blob):
+    """Encoder version recorded in a blob (legacy rows report LEGACY_ENCODER_VERSION)"""
+    if is_legacy(blob):
+        return LEGACY_ENCODER_VERSION
+    return read_header(blob).encoder_version
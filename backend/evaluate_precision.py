@@ -0,0 +1,125 @@
+"""
+Measure the accuracy cost of float16 / int8 gallery encodings against float32
+Runs leave-one-out identification over a labelled set: every encoding is
+matched (as a float32 probe, like a live capture) against all the others
+stored at each precision. Reports top-1 accuracy, accept/reject decisions
+that differ from float32, confidence drift, gallery memory and speed.
+
+The labelled set is either a directory holding one sub-directory of face
+images per person, or (no argument) the employees in the face database.
+
+Usage: python evaluate_precision.py [image_dir] [tolerance] [max_probes]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+from face_utils import encode_image_bytes, fuse_scores, pack_encodings, score_encodings
+
+PRECISIONS = ("float32", "float16", "int8")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def load_image_dir(root):
+    """Encode every face image under root/<label>/; returns (matrix, labels)"""
+    rows, labels = [], []
+    skipped = 0
+    for label in sorted(os.listdir(root)):
+        folder = os.path.join(root, label)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            with open(os.path.join(folder, name), "rb") as f:
+                face = encode_image_bytes(f.read())
+            if face.error or face.issues:
+                skipped += 1
+                continue
+            rows.append(face.encoding)
+            labels.append(label)
+    if skipped:
+        print(f"⚠ Skipped {skipped} images without a usable face")
+    return np.asarray(rows, dtype=np.float32), np.asarray(labels)
+
+
+def load_database():
+    """Primary and sample encodings from the face database, labelled by employee"""
+    from build_prototypes import load_encodings
+    from database import Session
+
+    session = Session()
+    try:
+        encodings = load_encodings(session)
+    finally:
+        session.close()
+    rows, labels = [], []
+    for employee_id, (_, employee_rows) in sorted(encodings.items()):
+        rows.extend(employee_rows)
+        labels.extend([employee_id] * len(employee_rows))
+    return np.asarray(rows, dtype=np.float32), np.asarray(labels)
+
+
+def leave_one_out(matrix, labels, probes, precision, tolerance):
+    """Best label, its fused confidence and whether it passes, for every probe row"""
+    values, stats = pack_encodings(matrix, precision)
+    _, owners = np.unique(labels, return_inverse=True)
+    best_owner = np.empty(len(probes), dtype=np.int64)
+    best_conf = np.empty(len(probes))
+    accepted = np.empty(len(probes), dtype=bool)
+
+    start = time.perf_counter()
+    for out, i in enumerate(probes):
+        keep = np.arange(len(matrix)) != i
+        confidences = score_encodings(values[keep], matrix[i], tuple(stat[keep] for stat in stats))
+        owner_ids, best, fused = fuse_scores(confidences, owners[keep])
+        top = np.argmax(fused)
+        best_owner[out] = owner_ids[top]
+        best_conf[out] = fused[top]
+        accepted[out] = best[top] >= 1.0 - tolerance
+    elapsed_ms = (time.perf_counter() - start) / len(probes) * 1000.0
+    return owners[probes], best_owner, best_conf, accepted, values.nbytes, elapsed_ms
+
+
+def main():
+    args = sys.argv[1:]
+    image_dir = args.pop(0) if args and os.path.isdir(args[0]) else None
+    tolerance = float(args[0]) if args else 0.5
+    max_probes = int(args[1]) if len(args) > 1 else 500
+
+    matrix, labels = load_image_dir(image_dir) if image_dir else load_database()
+    # Only encodings whose label has another encoding can be identified
+    _, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    probes = np.flatnonzero(counts[inverse] > 1)
+    if not len(probes) or len(np.unique(labels)) < 2:
+        print("✗ Need at least two people and one person with two or more encodings")
+        return
+    if len(probes) > max_probes:
+        probes = np.sort(np.random.default_rng(0).choice(probes, max_probes, replace=False))
+
+    print("=" * 72)
+    print(f"Labelled set: {len(matrix)} encodings of {len(np.unique(labels))} people, "
+          f"{len(probes)} probes, tolerance {tolerance}")
+    print("=" * 72)
+
+    reference = None
+    for precision in PRECISIONS:
+        truth, owner, conf, accepted, nbytes, ms = leave_one_out(matrix, labels, probes, precision, tolerance)
+        correct = owner == truth
+        line = (f"{precision:>8}  top-1 {correct.mean():.4f}  "
+                f"accepted correct {(correct & accepted).mean():.4f}  wrong {(~correct & accepted).mean():.4f}  "
+                f"{nbytes / 1e6:7.2f} MB  {ms:6.2f} ms/probe")
+        if reference is None:
+            reference = (owner, conf, accepted)
+        else:
+            changed = (owner != reference[0]) | (accepted != reference[2])
+            drift = np.abs(conf - reference[1])
+            line += f"\n{'':>8}  vs float32: {changed.sum()} decisions changed, " \
+                    f"confidence drift mean {drift.mean():.2e} max {drift.max():.2e}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
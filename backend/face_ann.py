@@ -0,0 +1,145 @@
+"""Approximate nearest-neighbour index for large face galleries
+
+An IVF (inverted file) index: gallery rows are clustered with k-means and
+each row id is filed under its nearest centroid. A search only scans the
+rows filed under the `n_probe` centroids closest to the probe and returns a
+short candidate list, which the gallery then rescores exactly with the
+multi-metric kernel.
+
+The index stores only centroids and row ids; vectors stay in the gallery
+matrix and are passed in at search time.
+"""
+import numpy as np
+
+# Rows used to train the centroids, per list
+_TRAIN_ROWS_PER_LIST = 64
+_ASSIGN_CHUNK = 4096
+
+
+def _squared_distances(vectors, centroids, centroid_norms):
+    """Squared L2 distance from each vector to each centroid (rows x lists)"""
+    vector_norms = np.einsum("ij,ij->i", vectors, vectors)
+    return vector_norms[:, None] - 2.0 * (vectors @ centroids.T) + centroid_norms[None, :]
+
+
+class IVFIndex:
+    """Coarse-quantizer index over the rows of an encoding matrix
+
+    Args:
+        n_lists: Number of k-means clusters; 0 picks ~sqrt(rows) at build time
+        n_probe: Default number of clusters scanned per search
+    """
+
+    def __init__(self, n_lists=0, n_probe=8):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+        self.centroid_norms = np.empty(0, dtype=np.float32)
+        self.lists = []
+
+    def __len__(self):
+        return sum(len(ids) for ids in self.lists)
+
+    @property
+    def is_trained(self):
+        return len(self.centroids) > 0
+
+    def _assign(self, vectors):
+        labels = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), _ASSIGN_CHUNK):
+            chunk = vectors[start:start + _ASSIGN_CHUNK]
+            dist = _squared_distances(chunk, self.centroids, self.centroid_norms)
+            labels[start:start + _ASSIGN_CHUNK] = np.argmin(dist, axis=1)
+        return labels
+
+    def build(self, matrix, iterations=10, seed=0):
+        """Train centroids with k-means and file every row of `matrix`"""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        rows = len(matrix)
+        if rows == 0:
+            self.centroids = np.empty((0, 0), dtype=np.float32)
+            self.centroid_norms = np.empty(0, dtype=np.float32)
+            self.lists = []
+            return self
+
+        n_lists = self.n_lists or int(np.sqrt(rows))
+        n_lists = max(1, min(n_lists, rows))
+        rng = np.random.default_rng(seed)
+
+        train = matrix
+        if rows > n_lists * _TRAIN_ROWS_PER_LIST:
+            train = matrix[rng.choice(rows, n_lists * _TRAIN_ROWS_PER_LIST, replace=False)]
+
+        centroids = train[rng.choice(len(train), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            self.centroids = centroids
+            self.centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+            labels = self._assign(train)
+
+            # Cluster sums via sort + reduceat instead of a Python loop
+            order = np.argsort(labels, kind="stable")
+            present, starts, counts = np.unique(labels[order], return_index=True, return_counts=True)
+            sums = np.add.reduceat(train[order], starts, axis=0)
+            centroids = centroids.copy()
+            centroids[present] = sums / counts[:, None]
+
+            # Re-seed empty clusters from random training rows
+            empty = np.setdiff1d(np.arange(n_lists), present)
+            if len(empty):
+                centroids[empty] = train[rng.choice(len(train), len(empty), replace=False)]
+
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.centroid_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        self.lists = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+        self.add(matrix, np.arange(rows, dtype=np.int64))
+        return self
+
+    def add(self, vectors, row_ids):
+        """File new rows under their nearest centroid (incremental insert)"""
+        if not self.is_trained:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.centroids.shape[1])
+        row_ids = np.asarray(row_ids, dtype=np.int64).ravel()
+        labels = self._assign(vectors)
+        lists = list(self.lists)
+        for label in np.unique(labels):
+            lists[label] = np.concatenate([lists[label], row_ids[labels == label]])
+        self.lists = lists
+
+    def remap(self, keep):
+        """Drop rows where `keep` is False and renumber the rest to match the
+        compacted gallery matrix"""
+        keep = np.asarray(keep, dtype=bool)
+        new_ids = np.cumsum(keep) - 1
+        self.lists = [new_ids[ids[keep[ids]]] for ids in self.lists]
+
+    def update(self, row_id, vector):
+        """Re-file a row whose vector changed in place"""
+        self.lists = [ids[ids != row_id] for ids in self.lists]
+        self.add(vector, [row_id])
+
+    def search(self, matrix, probe, k=50, n_probe=None, scales=None):
+        """Return up to `k` candidate row ids, nearest first
+
+        Only the rows filed under the `n_probe` closest centroids are scanned.
+        A float16 or int8 matrix is widened for the scanned rows only; `scales`
+        are the int8 per-row scales.
+        """
+        if not self.is_trained:
+            return np.empty(0, dtype=np.int64)
+
+        probe = np.asarray(probe, dtype=np.float32).reshape(1, -1)
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        centroid_dist = _squared_distances(probe, self.centroids, self.centroid_norms)[0]
+        probed = np.argpartition(centroid_dist, n_probe - 1)[:n_probe]
+
+        candidates = np.concatenate([self.lists[label] for label in probed])
+        vectors = matrix[candidates].astype(np.float32, copy=False)
+        if scales is not None:
+            vectors *= scales[candidates, None]
+        diff = vectors - probe
+        dist = np.einsum("ij,ij->i", diff, diff)
+        if len(candidates) > k:
+            top = np.argpartition(dist, k - 1)[:k]
+            candidates, dist = candidates[top], dist[top]
+        return candidates[np.argsort(dist)]
@@ -0,0 +1,230 @@
+"""Face detector backends
+
+Each backend wraps one OpenCV detector behind the same interface:
+`detect(frame, context)` returns (x, y, w, h) boxes in frame coordinates.
+Instances hold their own model objects and are not thread-safe; face_utils
+hands them out through its DetectorPool.
+
+Backends are registered under a name (Config.FACE_DETECTOR):
+    ssd     res10 SSD, Caffe (res10_300x300_ssd_iter_140000.caffemodel + deploy.prototxt)
+    yunet   cv2.FaceDetectorYN (face_detection_yunet_2023mar.onnx); also sets
+            context.landmarks, which the sface encoder uses for alignment
+    tf_ssd  the same SSD, TensorFlow uint8 build (opencv_face_detector_uint8.pb + .pbtxt)
+    haar    Haar cascade bundled with OpenCV (always available)
+Model files are looked up in Config.FACE_MODEL_DIR. "auto" uses ssd when
+its files are present, otherwise haar; the other backends must be named.
+"""
+import logging
+import os
+
+import cv2
+import numpy as np
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_BACKENDS = {}
+# Backends "auto" tries, in order
+AUTO_BACKENDS = ("ssd", "haar")
+
+
+def register(cls):
+    """Class decorator adding a backend to the registry"""
+    _BACKENDS[cls.name] = cls
+    return cls
+
+
+def scale_box(box, factor, shape):
+    """Scale an (x, y, w, h) box by factor and clip it to a frame of the given shape"""
+    h_max, w_max = shape[:2]
+    x, y = (min(int(round(v * factor)), limit - 1) for v, limit in ((box[0], w_max), (box[1], h_max)))
+    w = min(int(round(box[2] * factor)), w_max - x)
+    h = min(int(round(box[3] * factor)), h_max - y)
+    return (x, y, w, h)
+
+
+class FaceDetectorBackend:
+    """Base class; subclasses set `name` and `model_files` and implement detect()"""
+
+    name = None
+    model_files = ()
+    # True when detections come from an SSD DetectionOutput layer, which the
+    # DetectionBatcher can run for several frames in one forward pass
+    batchable = False
+
+    @classmethod
+    def model_paths(cls):
+        return [os.path.join(Config.FACE_MODEL_DIR, name) for name in cls.model_files]
+
+    @classmethod
+    def available(cls):
+        return all(os.path.exists(path) for path in cls.model_paths())
+
+    def detect(self, frame, context):
+        """Face boxes in frame coordinates
+
+        Args:
+            context: face_utils.FrameContext for the frame (cached gray/downscaled copies)
+        """
+        raise NotImplementedError
+
+
+@register
+class SSDDetector(FaceDetectorBackend):
+    """res10 SSD (Caffe); FACE_DETECT_INPUT_SIZE input, FACE_DETECT_CONFIDENCE threshold"""
+
+    name = "ssd"
+    model_files = ("deploy.prototxt", "res10_300x300_ssd_iter_140000.caffemodel")
+    batchable = True
+
+    def __init__(self):
+        config_file, model_file = self.model_paths()
+        self.net = cv2.dnn.readNetFromCaffe(config_file, model_file)
+
+    @staticmethod
+    def blob(frame):
+        size = Config.FACE_DETECT_INPUT_SIZE
+        return cv2.dnn.blobFromImage(cv2.resize(frame, (size, size)), 1.0, (size, size), (104.0, 177.0, 123.0))
+
+    @staticmethod
+    def parse(detections, shape):
+        """Boxes above FACE_DETECT_CONFIDENCE from one image's SSD output"""
+        (h, w) = shape[:2]
+        faces = []
+        for i in range(0, detections.shape[2]):
+            confidence = detections[0, 0, i, 2]
+
+            if confidence > Config.FACE_DETECT_CONFIDENCE:
+                box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
+                (x, y, x2, y2) = box.astype("int")
+                # Ensure coordinates are within frame bounds
+                x, y = max(0, x), max(0, y)
+                x2, y2 = min(w, x2), min(h, y2)
+                faces.append((x, y, x2-x, y2-y))
+        return faces
+
+    def forward(self, blob):
+        self.net.setInput(blob)
+        return self.net.forward()
+
+    def detect(self, frame, context):
+        return self.parse(self.forward(self.blob(frame)), frame.shape)
+
+
+@register
+class YuNetDetector(FaceDetectorBackend):
+    """OpenCV YuNet on the frame capped at DETECT_MAX_SIDE; YUNET_* thresholds"""
+
+    name = "yunet"
+    model_files = ("face_detection_yunet_2023mar.onnx",)
+
+    @classmethod
+    def available(cls):
+        return hasattr(cv2, "FaceDetectorYN") and super().available()
+
+    def __init__(self):
+        self.net = cv2.FaceDetectorYN.create(
+            self.model_paths()[0], "", (320, 320),
+            Config.YUNET_SCORE_THRESHOLD, Config.YUNET_NMS_THRESHOLD,
+        )
+        self._input_size = (320, 320)
+
+    def detect(self, frame, context):
+        small, scale = context.detection_frame(Config.DETECT_MAX_SIDE)
+        size = (small.shape[1], small.shape[0])
+        if size != self._input_size:
+            self.net.setInputSize(size)
+            self._input_size = size
+        _, detections = self.net.detect(small)
+        if detections is None:
+            return []
+        faces, landmarks = [], []
+        for row in detections:
+            x, y, w, h = row[:4]
+            # Boxes can extend past the frame edge
+            x0, x1 = np.clip((x, x + w), 0, size[0])
+            y0, y1 = np.clip((y, y + h), 0, size[1])
+            if x1 > x0 and y1 > y0:
+                faces.append(scale_box((x0, y0, x1 - x0, y1 - y0), 1.0 / scale, frame.shape))
+                # Box and five landmarks in frame coordinates (score kept), as alignCrop takes them
+                row = row.copy()
+                row[:14] /= scale
+                landmarks.append(row)
+        context.landmarks = landmarks
+        return faces
+
+
+@register
+class TFSSDDetector(SSDDetector):
+    """The res10 SSD as OpenCV's quantized TensorFlow graph (same input and output)"""
+
+    name = "tf_ssd"
+    model_files = ("opencv_face_detector.pbtxt", "opencv_face_detector_uint8.pb")
+
+    def __init__(self):
+        config_file, model_file = self.model_paths()
+        self.net = cv2.dnn.readNetFromTensorflow(model_file, config_file)
+
+
+@register
+class HaarDetector(FaceDetectorBackend):
+    """Haar cascade on the gray frame capped at DETECT_MAX_SIDE; FACE_MIN_SIZE,
+    FACE_SCALE_FACTOR and FACE_MIN_NEIGHBORS tune it"""
+
+    name = "haar"
+    cascade_file = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'  # type: ignore
+
+    @classmethod
+    def available(cls):
+        return os.path.exists(cls.cascade_file)
+
+    def __init__(self):
+        self.cascade = cv2.CascadeClassifier(self.cascade_file)
+
+    def detect(self, frame, context):
+        # Detect on a downscaled gray frame, then map boxes back to the working frame
+        gray, scale = context.detection_gray(Config.DETECT_MAX_SIDE)
+        # FACE_MIN_SIZE is in source pixels
+        min_size = max(1, round(Config.FACE_MIN_SIZE * scale * context.scale))
+        faces = self.cascade.detectMultiScale(
+            gray, scaleFactor=Config.FACE_SCALE_FACTOR, minNeighbors=Config.FACE_MIN_NEIGHBORS,
+            minSize=(min_size, min_size),
+        )
+        if scale != 1.0:
+            faces = [scale_box(face, 1.0 / scale, frame.shape) for face in faces]
+        return faces
+
+
+def backend_names():
+    """Registered backend names"""
+    return list(_BACKENDS)
+
+
+def get_backend(name):
+    """Backend class registered under name"""
+    try:
+        return _BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown face detector '{name}' (choose from: auto, {', '.join(_BACKENDS)})")
+
+
+def available_backends():
+    """Names of the backends whose model files are present"""
+    return [name for name, cls in _BACKENDS.items() if cls.available()]
+
+
+def select_backend(name="auto"):
+    """Backend class for a Config.FACE_DETECTOR value
+
+    A named backend whose model files are missing falls back to Haar, as
+    does "auto" when the SSD files are missing.
+    """
+    if name == "auto":
+        return next(_BACKENDS[candidate] for candidate in AUTO_BACKENDS if _BACKENDS[candidate].available())
+    cls = get_backend(name)
+    if not cls.available():
+        logger.warning(f"Face detector '{name}' model files not found in {Config.FACE_MODEL_DIR}; "
+                       "using the Haar cascade")
+        return HaarDetector
+    return cls
@@ -0,0 +1,144 @@
+"""Face encoder backends
+
+An encoder turns the detected face into the vector stored in the gallery.
+Every stored blob records the version of the encoder that produced it (see
+encoding_codec), and only encodings from the active encoder are loaded, so
+galleries from different encoders are never mixed. Switching encoders means
+re-registering faces.
+
+Backends are registered under a name (Config.FACE_ENCODER):
+    handcrafted  272-dim colour histogram + HOG + LBP + edge features, scored
+                 with the four-metric fusion in face_utils.score_encodings
+    sface        OpenCV SFace (cv2.FaceRecognizerSF), a 128-dim learned embedding
+                 scored by cosine similarity; needs face_recognition_sface_2021dec.onnx
+                 in FACE_MODEL_DIR and works best with the yunet detector, whose
+                 landmarks let it align the face
+Instances may hold model objects that are not thread-safe; face_utils hands
+them out through a pool.
+"""
+import logging
+import os
+
+import cv2
+import numpy as np
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_ENCODERS = {}
+
+
+def register(cls):
+    """Class decorator adding an encoder to the registry"""
+    _ENCODERS[cls.name] = cls
+    return cls
+
+
+class FaceEncoder:
+    """Base class; subclasses set the class attributes and implement encode()"""
+
+    name = None
+    # Stored in every blob; never reuse a version for a different encoder
+    version = None
+    dim = None
+    # "fused" (four-metric fusion) or "cosine"
+    metric = "fused"
+    # Samples per employee beyond which extra auto-train samples add little
+    max_samples = 20
+    model_files = ()
+
+    @classmethod
+    def model_paths(cls):
+        return [os.path.join(Config.FACE_MODEL_DIR, name) for name in cls.model_files]
+
+    @classmethod
+    def available(cls):
+        return all(os.path.exists(path) for path in cls.model_paths())
+
+    @staticmethod
+    def confidence(cosine):
+        """Map cosine similarities to match confidences (cosine encoders only)"""
+        raise NotImplementedError
+
+    def encode(self, frame, context):
+        """Encoding of the face at context.face_box as a float32 vector"""
+        raise NotImplementedError
+
+    def encode_many(self, frame, context, faces):
+        """(len(faces) x dim) float32 encodings of several faces, given as (box, landmarks) pairs"""
+        encodings = np.empty((len(faces), self.dim), dtype=np.float32)
+        for row, (box, landmarks) in zip(encodings, faces):
+            context.set_face(box, landmarks)
+            row[:] = self.encode(frame, context)
+        return encodings
+
+
+@register
+class HandcraftedEncoder(FaceEncoder):
+    name = "handcrafted"
+    version = 1
+    dim = 272
+
+    def __init__(self):
+        from face_utils import EncodingWorkspace
+        # Preallocated buffers, used by one thread at a time through the pool
+        self.workspace = EncodingWorkspace()
+
+    def encode(self, frame, context):
+        return self.workspace.encode(context.face_region)
+
+    def encode_many(self, frame, context, faces):
+        # Every face is written straight into its row of one matrix
+        encodings = np.empty((len(faces), self.dim), dtype=np.float32)
+        for row, (box, _) in zip(encodings, faces):
+            context.set_face(box)
+            self.workspace.encode(context.face_region, row)
+        return encodings
+
+
+@register
+class SFaceEncoder(FaceEncoder):
+    name = "sface"
+    version = 2
+    dim = 128
+    metric = "cosine"
+    max_samples = 5
+    model_files = ("face_recognition_sface_2021dec.onnx",)
+
+    @classmethod
+    def available(cls):
+        return hasattr(cv2, "FaceRecognizerSF") and super().available()
+
+    def __init__(self):
+        self.model = cv2.FaceRecognizerSF.create(self.model_paths()[0], "")
+
+    @staticmethod
+    def confidence(cosine):
+        # Rescaled so SFace's published cosine threshold lands on confidence 0.5
+        threshold = Config.SFACE_COSINE_THRESHOLD
+        return np.clip(0.5 + 0.5 * (cosine - threshold) / (1.0 - threshold), 0.0, 1.0)
+
+    def encode(self, frame, context):
+        if context.face_landmarks is not None:
+            face = self.model.alignCrop(frame, context.face_landmarks)
+        else:
+            # No landmarks from this detector: unaligned crop at the model's input size
+            face = cv2.resize(context.face_region, (112, 112))
+        return np.asarray(self.model.feature(face), dtype=np.float32).ravel()
+
+
+def select_encoder(name):
+    """Encoder class for a Config.FACE_ENCODER value
+
+    An encoder whose model file is missing falls back to the handcrafted one.
+    """
+    try:
+        cls = _ENCODERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown face encoder '{name}' (choose from: {', '.join(_ENCODERS)})")
+    if not cls.available():
+        logger.warning(f"Face encoder '{name}' model file not found in {Config.FACE_MODEL_DIR}; "
+                       "using the handcrafted encoder")
+        return HandcraftedEncoder
+    return cls
@@ -0,0 +1,751 @@
+"""In-memory face gallery for 1:N matching
+
+Holds every active employee's primary and sample encodings as one contiguous
+float32 matrix with a parallel array of owner ids, so recognition never has to
+touch the database or unpickle anything. The gallery is loaded once per
+process and kept current by the code paths that write encodings.
+"""
+import logging
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from config import Config
+from database import Session
+from models import Employee, FaceSample, FacePrototype
+from face_ann import IVFIndex
+from face_prototypes import pairwise_distances
+from face_utils import (
+    bytes_to_encoding, pack_encodings, unpack_encodings, score_encodings, score_encodings_many, fuse_scores,
+    encoder_backend, is_current_encoding,
+)
+
+logger = logging.getLogger(__name__)
+
+# Sample id used for an employee's primary encoding row
+PRIMARY_SAMPLE_ID = -1
+
+GalleryEntry = namedtuple("GalleryEntry", ["id", "name", "user_id"])
+
+# Rows matched first when prototype compression is active (copies of gallery rows)
+CompactView = namedtuple("CompactView", ["matrix", "owners", "stats", "rows_by_owner"])
+
+
+def _scales(stats):
+    """int8 per-row scales carried in the gallery stats, or None"""
+    return stats[2] if len(stats) > 2 else None
+
+
+def _group_rows(owners):
+    """employee id -> indices of that employee's rows"""
+    order = np.argsort(owners, kind="stable")
+    owner_ids, starts = np.unique(owners[order], return_index=True)
+    return {
+        int(employee_id): rows
+        for employee_id, rows in zip(owner_ids, np.split(order, starts[1:]))
+    }
+
+
+def _score_employees(encoding, employee_ids, matrix, stats, rows_by_owner):
+    """Score a probe against every row of the given employees
+
+    Returns:
+        fuse_scores output for those employees
+    """
+    rows = np.concatenate([rows_by_owner[int(employee_id)] for employee_id in employee_ids])
+    confidences = score_encodings(matrix[rows], encoding, tuple(stat[rows] for stat in stats))
+    return fuse_scores(confidences, np.repeat(
+        np.asarray(employee_ids, dtype=np.int64), [len(rows_by_owner[int(e)]) for e in employee_ids]
+    ))
+
+
+def _rescore_candidates(owner_ids, best, threshold):
+    """Employees whose prototype score warrants an exact rescore over all their rows
+
+    Those within PROTOTYPE_FALLBACK_MARGIN of both the threshold and the best
+    prototype score: the borderline ones, since exact scores are never below
+    prototype scores and only the top of the ranking decides a match.
+    PROTOTYPE_RESCORE_TOP_K caps their number (highest prototype scores first).
+    """
+    if not len(best):
+        return owner_ids[:0]
+    margin = Config.PROTOTYPE_FALLBACK_MARGIN
+    close = np.flatnonzero((best >= threshold - margin) & (best >= best.max() - margin))
+    if len(close) > Config.PROTOTYPE_RESCORE_TOP_K:
+        close = np.sort(close[np.argsort(-best[close], kind="stable")[:Config.PROTOTYPE_RESCORE_TOP_K]])
+    return owner_ids[close]
+
+
+class FaceGallery:
+    """Contiguous matrix of known encodings with owner bookkeeping
+
+    Updates are copy-on-write: every mutation builds new arrays and swaps them
+    in under the lock, so readers can match against a snapshot without locking.
+
+    Rows are held at Config.GALLERY_PRECISION (see face_utils.pack_encodings);
+    for int8 the per-row scales travel as a third element of `stats`.
+
+    When prototypes are loaded (build_prototypes.py), matching scans only each
+    compressed employee's prototype rows (plus samples added since the build)
+    and rescores employees close to the threshold against all their rows.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self.precision = Config.GALLERY_PRECISION
+        self.matrix, self.stats = pack_encodings(np.empty((0, 0), dtype=np.float32), self.precision)
+        self.owners = np.empty(0, dtype=np.int64)
+        self.sample_ids = np.empty(0, dtype=np.int64)
+        self.entries = {}
+        self.rows_by_owner = {}
+        self.user_index = {}
+        self._cohorts = {}
+        self.compact_keep = {}
+        self.compact = None
+        self.sample_quality = {}
+        self.ann = None
+        self._generation = 0
+        self._rebuild_thread = None
+
+    def __len__(self):
+        return len(self.owners)
+
+    def memory_stats(self):
+        """Size of the in-memory gallery"""
+        compact = self.compact
+        return {
+            "employees": len(self.entries),
+            "encodings": len(self.owners),
+            "precision": self.precision,
+            "encoder": encoder_backend().name,
+            "matrix_bytes": int(self.matrix.nbytes),
+            "compact_encodings": len(compact.owners) if compact is not None else None,
+            "ann_index": self.ann is not None,
+        }
+
+    # ------------------------------------------------------------------ loading
+
+    def load(self):
+        """(Re)build the gallery from the face database in two queries"""
+        session = Session()
+        try:
+            employees = session.query(Employee).filter(Employee.is_active == 1).all()
+            samples = (
+                session.query(FaceSample.id, FaceSample.employee_id, FaceSample.face_encoding,
+                              FaceSample.quality_score)
+                .join(Employee, Employee.id == FaceSample.employee_id)
+                .filter(Employee.is_active == 1)
+                .all()
+            )
+
+            entries = {}
+            rows, owners, sample_ids = [], [], []
+            # Encodings from another encoder (see face_encoders.py) are left out
+            stale = 0
+            for emp in employees:
+                if not is_current_encoding(emp.face_encoding):
+                    stale += 1
+                    continue
+                entries[emp.id] = GalleryEntry(emp.id, emp.name, emp.user_id)
+                rows.append(bytes_to_encoding(emp.face_encoding))
+                owners.append(emp.id)
+                sample_ids.append(PRIMARY_SAMPLE_ID)
+            qualities = {}
+            for sample_id, employee_id, blob, quality in samples:
+                if employee_id not in entries or not is_current_encoding(blob):
+                    stale += 1
+                    continue
+                rows.append(bytes_to_encoding(blob))
+                owners.append(employee_id)
+                sample_ids.append(sample_id)
+                qualities[sample_id] = quality or 0.0
+            prototypes = {
+                proto.employee_id: (proto.sample_ids(), proto.max_sample_id)
+                for proto in session.query(FacePrototype).all()
+            }
+        finally:
+            session.close()
+
+        matrix, owners, sample_ids = self._stack(rows, owners, sample_ids)
+        self.load_arrays(matrix, owners, sample_ids, entries, prototypes=prototypes, qualities=qualities)
+        compact_rows = len(self.compact.owners) if self.compact is not None else len(owners)
+        logger.info(f"Face gallery loaded: {len(entries)} employees, {len(owners)} encodings "
+                    f"({compact_rows} matched first)")
+        if stale:
+            logger.warning(f"Skipped {stale} encodings from another face encoder; "
+                           "affected employees must register again")
+
+    def load_arrays(self, matrix, owners, sample_ids, entries, build_index=True, prototypes=None,
+                    qualities=None):
+        """Replace the gallery contents with prepared arrays
+
+        Args:
+            entries: employee id -> GalleryEntry for every owner in `owners`
+            build_index: Build the ANN index synchronously when enabled
+            prototypes: employee id -> (kept sample ids, max sample id at build time)
+            qualities: sample id -> stored quality_score (used to pick auto-train replacements)
+        """
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        ann = self._build_index(matrix) if build_index else None
+        precision = Config.GALLERY_PRECISION
+        matrix, stats = pack_encodings(matrix, precision)
+        with self._lock:
+            self.precision = precision
+            self.matrix = matrix
+            self.owners = np.asarray(owners, dtype=np.int64)
+            self.sample_ids = np.asarray(sample_ids, dtype=np.int64)
+            self.stats = stats
+            self.entries = dict(entries)
+            self.compact_keep = dict(prototypes or {})
+            self.sample_quality = dict(qualities or {})
+            self.ann = ann
+            self._generation += 1
+            self._reindex()
+            self._loaded = True
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.load()
+
+    @staticmethod
+    def _stack(rows, owners, sample_ids):
+        """Stack encodings into a float32 matrix, dropping rows of the wrong size"""
+        if not rows:
+            return (np.empty((0, 0), dtype=np.float32),
+                    np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+        dim = np.asarray(rows[0]).size
+        keep = [i for i, row in enumerate(rows) if np.asarray(row).size == dim]
+        if len(keep) != len(rows):
+            logger.warning(f"Skipped {len(rows) - len(keep)} encodings with unexpected dimension")
+
+        matrix = np.empty((len(keep), dim), dtype=np.float32)
+        for out, i in enumerate(keep):
+            matrix[out] = np.asarray(rows[i], dtype=np.float32).ravel()
+        return (matrix,
+                np.asarray([owners[i] for i in keep], dtype=np.int64),
+                np.asarray([sample_ids[i] for i in keep], dtype=np.int64))
+
+    # --------------------------------------------------------------- ANN index
+
+    @staticmethod
+    def _build_index(matrix):
+        """Build an IVF index for the matrix if the gallery is large enough"""
+        if not Config.ANN_ENABLED or len(matrix) < Config.ANN_MIN_ROWS:
+            return None
+        return IVFIndex(n_lists=Config.ANN_LISTS, n_probe=Config.ANN_PROBES).build(matrix)
+
+    def rebuild_index_async(self, reload=True):
+        """Rebuild the ANN index on a background thread
+
+        With `reload`, the gallery is first refreshed from the database. The
+        index is trained outside the lock on a snapshot; rows appended while it
+        trains are filed incrementally before it is swapped in, and the result
+        is discarded if rows were removed in the meantime.
+        """
+        if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+            return self._rebuild_thread
+
+        def rebuild():
+            try:
+                if reload:
+                    self.load()
+                for _ in range(3):
+                    with self._lock:
+                        matrix, stats, generation = self.matrix, self.stats, self._generation
+                    ann = self._build_index(unpack_encodings(matrix, _scales(stats)))
+                    with self._lock:
+                        if generation != self._generation:
+                            continue
+                        if ann is not None and len(self.matrix) > len(matrix):
+                            scales = _scales(self.stats)
+                            ann.add(unpack_encodings(self.matrix[len(matrix):],
+                                                     None if scales is None else scales[len(matrix):]),
+                                    np.arange(len(matrix), len(self.matrix)))
+                        self.ann = ann
+                        logger.info(f"Face gallery ANN index rebuilt over {len(self.matrix)} encodings")
+                        return
+                logger.warning("Face gallery ANN rebuild abandoned: gallery kept changing")
+            except Exception as e:
+                logger.error(f"Face gallery ANN rebuild failed: {e}")
+
+        self._rebuild_thread = threading.Thread(target=rebuild, name="gallery-ann-rebuild", daemon=True)
+        self._rebuild_thread.start()
+        return self._rebuild_thread
+
+    def _candidate_rows(self, encoding):
+        """Rows of the employees owning the ANN top-k candidates, or None to scan everything
+
+        Must be called with the lock held.
+        """
+        if self.ann is None:
+            return None
+        candidates = self.ann.search(self.matrix, encoding, k=Config.ANN_TOP_K, scales=_scales(self.stats))
+        employee_ids = np.unique(self.owners[candidates])
+        if not len(employee_ids):
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self.rows_by_owner[int(employee_id)] for employee_id in employee_ids])
+
+    # ---------------------------------------------------------------- mutation
+
+    def _reindex(self):
+        """Rebuild the per-employee row index, user id lookup and compact view"""
+        self.rows_by_owner = _group_rows(self.owners)
+        self.user_index = {entry.user_id: entry.id for entry in self.entries.values() if entry.user_id}
+        self._cohorts = {}
+        self._rebuild_compact()
+
+    def _rebuild_compact(self):
+        """Select the compact rows from the prototype sets; lock must be held"""
+        if not Config.PROTOTYPES_ENABLED or not any(e in self.rows_by_owner for e in self.compact_keep):
+            self.compact = None
+            return
+        keep = np.ones(len(self.owners), dtype=bool)
+        for employee_id, (kept_ids, max_sample_id) in self.compact_keep.items():
+            rows = self.rows_by_owner.get(employee_id)
+            if rows is None:
+                continue
+            ids = self.sample_ids[rows]
+            kept = np.isin(ids, list(kept_ids)) | (ids > max_sample_id)
+            if kept.any():  # Prototypes whose samples were deleted: fall back to every row
+                keep[rows] = kept
+        rows = np.flatnonzero(keep)
+        owners = self.owners[rows]
+        self.compact = CompactView(
+            np.ascontiguousarray(self.matrix[rows]), owners,
+            tuple(stat[rows] for stat in self.stats), _group_rows(owners),
+        )
+
+    def _append(self, encoding, employee_id, sample_id):
+        row = np.asarray(encoding, dtype=np.float32).reshape(1, -1)
+        if len(self.owners) and row.shape[1] != self.matrix.shape[1]:
+            logger.warning(f"Encoding for employee {employee_id} has unexpected dimension {row.shape[1]}")
+            return
+        packed, row_stats = pack_encodings(row, self.precision)
+        matrix = packed if not len(self.owners) else np.vstack([self.matrix, packed])
+        self.matrix = np.ascontiguousarray(matrix)
+        self.owners = np.append(self.owners, employee_id)
+        self.sample_ids = np.append(self.sample_ids, sample_id)
+        self.stats = tuple(np.append(old, new) for old, new in zip(self.stats, row_stats))
+        rows_by_owner = dict(self.rows_by_owner)
+        rows_by_owner[employee_id] = np.append(rows_by_owner.get(employee_id, np.empty(0, dtype=np.int64)),
+                                               len(self.owners) - 1)
+        self.rows_by_owner = rows_by_owner
+        self._cohorts = {}
+        if self.compact is not None:
+            # New rows are always matched until the next prototype build
+            compact = self.compact
+            compact_rows = dict(compact.rows_by_owner)
+            compact_rows[employee_id] = np.append(compact_rows.get(employee_id, np.empty(0, dtype=np.int64)),
+                                                  len(compact.owners))
+            self.compact = CompactView(
+                np.ascontiguousarray(np.vstack([compact.matrix, packed])),
+                np.append(compact.owners, employee_id),
+                tuple(np.append(old, new) for old, new in zip(compact.stats, row_stats)),
+                compact_rows,
+            )
+        if self.ann is not None:
+            self.ann.add(row, [len(self.owners) - 1])
+        elif Config.ANN_ENABLED and len(self.owners) >= Config.ANN_MIN_ROWS:
+            self.rebuild_index_async(reload=False)
+
+    def _overwrite_row(self, row, encoding, sample_id):
+        """Replace one row's encoding and sample id in place; lock must be held"""
+        packed, row_stats = pack_encodings(encoding, self.precision)
+        matrix = self.matrix.copy()
+        matrix[row] = packed[0]
+        stats = tuple(stat.copy() for stat in self.stats)
+        for stat, row_stat in zip(stats, row_stats):
+            stat[row] = row_stat[0]
+        sample_ids = self.sample_ids.copy()
+        sample_ids[row] = sample_id
+        self._generation += 1
+        self.matrix = matrix
+        self.stats = stats
+        self.sample_ids = sample_ids
+        self._cohorts = {}
+        if self.ann is not None:
+            self.ann.update(row, np.asarray(encoding, dtype=np.float32).ravel())
+
+    def set_primary(self, employee, encoding):
+        """Add an employee or replace their primary encoding and details"""
+        self.ensure_loaded()
+        with self._lock:
+            entries = dict(self.entries)
+            entries[employee.id] = GalleryEntry(employee.id, employee.name, employee.user_id)
+            primary = np.flatnonzero((self.owners == employee.id) & (self.sample_ids == PRIMARY_SAMPLE_ID))
+            if len(primary):
+                self._overwrite_row(primary[0], encoding, PRIMARY_SAMPLE_ID)
+                # Prototypes picked from the old samples no longer apply
+                if employee.id in self.compact_keep:
+                    compact_keep = dict(self.compact_keep)
+                    del compact_keep[employee.id]
+                    self.compact_keep = compact_keep
+                self._rebuild_compact()
+            else:
+                self._append(encoding, employee.id, PRIMARY_SAMPLE_ID)
+            self.entries = entries
+            user_index = {user_id: eid for user_id, eid in self.user_index.items() if eid != employee.id}
+            if employee.user_id:
+                user_index[employee.user_id] = employee.id
+            self.user_index = user_index
+
+    def add_sample(self, employee_id, sample_id, encoding, quality=0.0):
+        """Add a FaceSample encoding for an employee already in the gallery"""
+        self.ensure_loaded()
+        with self._lock:
+            if employee_id not in self.entries:
+                return
+            self._append(encoding, employee_id, sample_id)
+            self.sample_quality = {**self.sample_quality, sample_id: quality}
+
+    def replace_sample(self, employee_id, old_sample_id, sample_id, encoding, quality=0.0):
+        """Swap one of an employee's samples for a new FaceSample (see plan_sample)"""
+        self.ensure_loaded()
+        with self._lock:
+            if employee_id not in self.entries:
+                return
+            rows = self.rows_by_owner.get(employee_id, np.empty(0, dtype=np.int64))
+            match = rows[self.sample_ids[rows] == old_sample_id]
+            if not len(match):
+                self._append(encoding, employee_id, sample_id)
+            else:
+                self._overwrite_row(match[0], encoding, sample_id)
+                if self.compact is not None:
+                    # The new id is newer than any prototype build, so it joins the compact view
+                    self._rebuild_compact()
+            sample_quality = dict(self.sample_quality)
+            sample_quality.pop(old_sample_id, None)
+            sample_quality[sample_id] = quality
+            self.sample_quality = sample_quality
+
+    def plan_sample(self, employee_id, encoding, quality):
+        """Decide whether an auto-train capture should be stored for an employee
+
+        A capture nearly identical to a stored encoding adds nothing and is
+        skipped. Below AUTO_TRAIN_MAX_SAMPLES (or the encoder's own, lower
+        max_samples: a learned embedding needs few samples) it is added; at the cap it
+        replaces the weakest sample - one below AUTO_TRAIN_MIN_QUALITY first,
+        otherwise the one most similar to the others - but only when the set
+        becomes more diverse. The primary encoding and prototype samples are
+        never replaced.
+
+        Returns:
+            ("skip", None), ("add", None) or ("replace", sample id to replace)
+        """
+        self.ensure_loaded()
+        with self._lock:
+            rows = self.rows_by_owner.get(employee_id)
+            if rows is None:
+                return "skip", None
+            matrix = self.matrix[rows]
+            stats = tuple(stat[rows] for stat in self.stats)
+            sample_ids = self.sample_ids[rows]
+            protected = self.compact_keep.get(employee_id, (frozenset(), 0))[0]
+            sample_quality = self.sample_quality
+
+        similarity = score_encodings(matrix, encoding, stats)
+        if similarity.max() >= Config.AUTO_TRAIN_DUPLICATE_SIMILARITY:
+            return "skip", None
+        samples = sample_ids != PRIMARY_SAMPLE_ID
+        if np.count_nonzero(samples) < min(Config.AUTO_TRAIN_MAX_SAMPLES, encoder_backend().max_samples):
+            return "add", None
+
+        replaceable = samples & ~np.isin(sample_ids, list(protected))
+        if not replaceable.any():
+            return "skip", None
+        # Redundancy: similarity to the closest other stored encoding
+        closeness = 1.0 - pairwise_distances(unpack_encodings(matrix, _scales(stats)))
+        np.fill_diagonal(closeness, -np.inf)
+        redundancy = closeness.max(axis=1)
+        qualities = np.array([sample_quality.get(int(i), 0.0) for i in sample_ids])
+        candidates = np.flatnonzero(replaceable)
+        poor = candidates[qualities[candidates] < Config.AUTO_TRAIN_MIN_QUALITY]
+        if len(poor):
+            victim = poor[np.argmin(qualities[poor])]
+            return "replace", int(sample_ids[victim])
+        victim = candidates[np.argmax(redundancy[candidates])]
+        # Redundancy of the capture once the victim is gone
+        if np.delete(similarity, victim).max() < redundancy[victim]:
+            return "replace", int(sample_ids[victim])
+        return "skip", None
+
+    def remove_employee(self, employee_id):
+        """Drop every encoding owned by an employee"""
+        self.ensure_loaded()
+        with self._lock:
+            keep = self.owners != employee_id
+            removed = set(self.sample_ids[~keep].tolist())
+            if self.ann is not None:
+                self.ann.remap(keep)
+            self._generation += 1
+            self.matrix = np.ascontiguousarray(self.matrix[keep])
+            self.owners = self.owners[keep]
+            self.sample_ids = self.sample_ids[keep]
+            self.stats = tuple(stat[keep] for stat in self.stats)
+            entries = dict(self.entries)
+            entries.pop(employee_id, None)
+            self.entries = entries
+            self.compact_keep = {e: spec for e, spec in self.compact_keep.items() if e != employee_id}
+            self.sample_quality = {i: q for i, q in self.sample_quality.items() if i not in removed}
+            self._reindex()
+
+    # ---------------------------------------------------------------- matching
+
+    def snapshot(self):
+        """Consistent (matrix, owners, sample_ids, stats, entries) view for matching"""
+        self.ensure_loaded()
+        with self._lock:
+            return self.matrix, self.owners, self.sample_ids, self.stats, self.entries
+
+    def identify(self, encoding, tolerance=0.5):
+        """Find the best matching employee for a probe encoding
+
+        Returns:
+            (best_entry or None, best_confidence, [(entry, confidence, sample_count), ...])
+            with the per-employee scores in employee id order.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            matrix, owners, _, stats, entries = self.snapshot()
+            rows_by_owner = self.rows_by_owner
+            candidate_rows = self._candidate_rows(encoding)
+            compact = self.compact
+        if candidate_rows is not None:
+            # Exact rescoring of the ANN shortlist (all rows of each candidate employee)
+            matrix = matrix[candidate_rows]
+            owners = owners[candidate_rows]
+            stats = tuple(stat[candidate_rows] for stat in stats)
+            compact = None
+        if not len(owners):
+            return None, 0.0, []
+
+        if compact is not None:
+            # Prototype rows first; employees that might pass get exact scores over all their rows
+            owner_ids, best, fused = fuse_scores(score_encodings(compact.matrix, encoding, compact.stats), compact.owners)
+            close = _rescore_candidates(owner_ids, best, 1.0 - tolerance)
+            if len(close):
+                _, exact_best, exact_fused = _score_employees(encoding, close, matrix, stats, rows_by_owner)
+                positions = np.searchsorted(owner_ids, close)
+                best[positions] = exact_best
+                fused[positions] = exact_fused
+            counts = np.array([len(rows_by_owner[int(employee_id)]) for employee_id in owner_ids])
+        else:
+            # One kernel call for every row, then a per-employee best/mean reduction
+            confidences = score_encodings(matrix, encoding, stats)
+            owner_ids, best, fused = fuse_scores(confidences, owners)
+            counts = np.bincount(np.searchsorted(owner_ids, owners), minlength=len(owner_ids))
+
+        scores = [
+            (entries[int(employee_id)], float(conf), int(count))
+            for employee_id, conf, count in zip(owner_ids, fused, counts)
+            if int(employee_id) in entries
+        ]
+
+        best_match = None
+        best_conf = 0.0
+        candidates = np.flatnonzero(best >= (1.0 - tolerance))
+        if len(candidates):
+            top = candidates[np.argmax(fused[candidates])]
+            entry = entries.get(int(owner_ids[top]))
+            if entry is not None and fused[top] > best_conf:
+                best_match = entry
+                best_conf = float(fused[top])
+
+        return best_match, best_conf, scores
+
+    def _score_many(self, encodings, tolerance):
+        """Per-employee scores for several probes in one score_encodings_many call
+
+        Uses the prototype rows when built, rescoring employees near the
+        threshold against all their rows like identify(). The ANN shortlist
+        is not used.
+
+        Returns:
+            (owner ids, best (P x E), fused (P x E), entries), or None for an
+            empty gallery
+        """
+        probes = np.asarray(encodings, dtype=np.float32).reshape(len(encodings), -1)
+        self.ensure_loaded()
+        with self._lock:
+            matrix, owners, _, stats, entries = self.snapshot()
+            rows_by_owner = self.rows_by_owner
+            compact = self.compact
+        if not len(owners):
+            return None
+
+        if compact is not None:
+            confidences = score_encodings_many(compact.matrix, probes, compact.stats)
+            row_owners = compact.owners
+        else:
+            confidences = score_encodings_many(matrix, probes, stats)
+            row_owners = owners
+        owner_ids = np.unique(row_owners)
+        best = np.empty((len(probes), len(owner_ids)))
+        fused = np.empty((len(probes), len(owner_ids)))
+        for i, (probe, probe_confidences) in enumerate(zip(probes, confidences)):
+            _, probe_best, probe_fused = fuse_scores(probe_confidences, row_owners)
+            if compact is not None:
+                close = _rescore_candidates(owner_ids, probe_best, 1.0 - tolerance)
+                if len(close):
+                    _, exact_best, exact_fused = _score_employees(probe, close, matrix, stats, rows_by_owner)
+                    positions = np.searchsorted(owner_ids, close)
+                    probe_best[positions] = exact_best
+                    probe_fused[positions] = exact_fused
+            best[i] = probe_best
+            fused[i] = probe_fused
+        return owner_ids, best, fused, entries
+
+    def identify_many(self, encodings, tolerance=0.5):
+        """Identify several probes at once (every face of a group check-in)
+
+        All probes are scored together (see _score_many), then assigned
+        one-to-one: passing (probe, employee) pairs are taken in order of
+        fused confidence, so two faces never claim the same employee.
+
+        Returns:
+            [(entry or None, confidence), ...] in probe order; an unmatched
+            probe carries its best fused confidence
+        """
+        scored = self._score_many(encodings, tolerance) if len(encodings) else None
+        if scored is None:
+            return [(None, 0.0)] * len(encodings)
+        owner_ids, best, fused, entries = scored
+
+        # Greedy one-to-one assignment, most confident pair first
+        eligible = np.where(best >= (1.0 - tolerance), fused, -np.inf)
+        matches = [None] * len(encodings)
+        taken = set()
+        for flat in np.argsort(eligible, axis=None, kind="stable")[::-1]:
+            probe, column = divmod(int(flat), eligible.shape[1])
+            if eligible[probe, column] == -np.inf:
+                break
+            entry = entries.get(int(owner_ids[column]))
+            if matches[probe] is not None or column in taken or entry is None:
+                continue
+            matches[probe] = (entry, float(fused[probe, column]))
+            taken.add(column)
+        return [
+            match if match is not None else (None, float(fused[probe].max()))
+            for probe, match in enumerate(matches)
+        ]
+
+    def top_matches(self, encodings, k=3, tolerance=0.5):
+        """The k most likely employees for each of several independent probes
+
+        Returns:
+            [[(entry, fused confidence, passes threshold), ...], ...] per probe,
+            most confident first
+        """
+        scored = self._score_many(encodings, tolerance) if len(encodings) else None
+        if scored is None:
+            return [[] for _ in range(len(encodings))]
+        owner_ids, best, fused, entries = scored
+        ranked = []
+        for probe_best, probe_fused in zip(best, fused):
+            top = np.argsort(-probe_fused, kind="stable")[:k]
+            ranked.append([
+                (entries[int(owner_ids[i])], float(probe_fused[i]), bool(probe_best[i] >= 1.0 - tolerance))
+                for i in top
+                if int(owner_ids[i]) in entries
+            ])
+        return ranked
+
+    def employee_for_user(self, user_id):
+        """Gallery entry linked to a main-app user id, or None"""
+        self.ensure_loaded()
+        employee_id = self.user_index.get(str(user_id))
+        return self.entries.get(employee_id) if employee_id is not None else None
+
+    def _cohort(self, employee_id, size):
+        """Ids of the `size` employees whose primary encodings are closest to this one's
+
+        These are the identities most likely to be confused with the claimed
+        one, so they make the cheapest useful impostor check. Cached until the
+        gallery changes. Must be called with the lock held.
+        """
+        key = (employee_id, size)
+        cached = self._cohorts.get(key)
+        if cached is not None:
+            return cached
+
+        primaries = np.flatnonzero(self.sample_ids == PRIMARY_SAMPLE_ID)
+        own = primaries[self.owners[primaries] == employee_id]
+        others = primaries[self.owners[primaries] != employee_id]
+        if size <= 0 or not len(own) or not len(others):
+            nearest = np.empty(0, dtype=np.int64)
+        else:
+            stats = tuple(stat[others] for stat in self.stats)
+            scales = _scales(self.stats)
+            probe = unpack_encodings(self.matrix[own[:1]], None if scales is None else scales[own[:1]])[0]
+            similarity = score_encodings(self.matrix[others], probe, stats)
+            nearest = self.owners[others[np.argsort(-similarity, kind="stable")[:size]]]
+        cohorts = dict(self._cohorts)
+        cohorts[key] = nearest
+        self._cohorts = cohorts
+        return nearest
+
+    def verify(self, encoding, employee_id, tolerance=0.5, cohort_size=10):
+        """1:1 check of a probe against one claimed employee
+
+        Scores only the claimed employee's rows plus a small cohort of the most
+        similar other employees. The claim is rejected when a cohort member
+        matches the probe better than the claimed employee does.
+
+        Returns:
+            (is_match, confidence, impostor_entry or None)
+        """
+        self.ensure_loaded()
+        with self._lock:
+            matrix, stats, rows_by_owner = self.matrix, self.stats, self.rows_by_owner
+            own_rows = rows_by_owner.get(employee_id)
+            if own_rows is None or not len(own_rows):
+                return False, 0.0, None
+            cohort = self._cohort(employee_id, cohort_size)
+            compact = self.compact
+            entries = self.entries
+
+        confidences = score_encodings(matrix[own_rows], encoding, tuple(stat[own_rows] for stat in stats))
+        best = float(confidences.max())
+        conf = float(0.7 * best + 0.3 * confidences.mean())
+        if best < (1.0 - tolerance):
+            return False, conf, None
+
+        if len(cohort):
+            if compact is not None:
+                owner_ids, cohort_best, cohort_fused = _score_employees(
+                    encoding, cohort, compact.matrix, compact.stats, compact.rows_by_owner
+                )
+                close = _rescore_candidates(owner_ids, cohort_best, 1.0 - tolerance)
+                if len(close):
+                    _, exact_best, exact_fused = _score_employees(encoding, close, matrix, stats, rows_by_owner)
+                    positions = np.searchsorted(owner_ids, close)
+                    cohort_best[positions] = exact_best
+                    cohort_fused[positions] = exact_fused
+            else:
+                owner_ids, cohort_best, cohort_fused = _score_employees(encoding, cohort, matrix, stats, rows_by_owner)
+            rivals = np.flatnonzero((cohort_best >= (1.0 - tolerance)) & (cohort_fused > conf))
+            if len(rivals):
+                top = rivals[np.argmax(cohort_fused[rivals])]
+                return False, conf, entries.get(int(owner_ids[top]))
+
+        return True, conf, None
+
+
+_gallery = None
+_gallery_lock = threading.Lock()
+
+
+def get_gallery():
+    """Return the process-wide gallery, loading it on first use"""
+    global _gallery
+    if _gallery is None:
+        with _gallery_lock:
+            if _gallery is None:
+                _gallery = FaceGallery()
+    _gallery.ensure_loaded()
+    return _gallery
@@ -0,0 +1,78 @@
+"""Per-employee prototype selection for gallery compression
+
+An employee can own a primary encoding plus up to 20 samples, most of them
+near-duplicates. k-medoids picks the few samples that best represent the
+rest, and samples far from every medoid are kept as outliers so unusual
+conditions (glasses, lighting) stay matchable. Medoids are real samples, so
+the compressed set is stored as sample ids (see models.FacePrototype).
+"""
+import numpy as np
+
+from face_utils import encoding_stats, score_encodings
+
+
+def pairwise_distances(matrix):
+    """Symmetric (N x N) matrix of 1 - score_encodings confidence"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    stats = encoding_stats(matrix)
+    dist = np.empty((len(matrix), len(matrix)))
+    for i in range(len(matrix)):
+        dist[i] = 1.0 - score_encodings(matrix, matrix[i], stats)
+    dist = (dist + dist.T) / 2.0
+    np.fill_diagonal(dist, 0.0)
+    return dist
+
+
+def k_medoids(dist, k):
+    """PAM k-medoids: greedy BUILD then SWAP until no swap lowers the total distance
+
+    Returns:
+        Sorted indices of the k medoids
+    """
+    n = len(dist)
+    if n <= k:
+        return np.arange(n)
+
+    medoids = [int(np.argmin(dist.sum(axis=1)))]
+    while len(medoids) < k:
+        nearest = dist[:, medoids].min(axis=1)
+        gains = np.maximum(nearest[:, None] - dist, 0.0).sum(axis=0)
+        gains[medoids] = -1.0
+        medoids.append(int(np.argmax(gains)))
+
+    cost = dist[:, medoids].min(axis=1).sum()
+    improved = True
+    while improved:
+        improved = False
+        for position in range(k):
+            for candidate in range(n):
+                if candidate in medoids:
+                    continue
+                trial = list(medoids)
+                trial[position] = candidate
+                trial_cost = dist[:, trial].min(axis=1).sum()
+                if trial_cost < cost - 1e-12:
+                    medoids, cost, improved = trial, trial_cost, True
+    return np.array(sorted(medoids))
+
+
+def select_prototypes(matrix, k=3, max_outliers=1, outlier_distance=0.1):
+    """Choose representative rows of one employee's encodings
+
+    Args:
+        k: Medoids to keep
+        max_outliers: Most extra rows kept for samples far from every medoid
+        outlier_distance: Distance to the nearest medoid beyond which a row is an outlier
+
+    Returns:
+        (medoid row indices, outlier row indices)
+    """
+    if len(matrix) <= k:
+        return np.arange(len(matrix)), np.empty(0, dtype=np.int64)
+
+    dist = pairwise_distances(matrix)
+    medoids = k_medoids(dist, k)
+    nearest = dist[:, medoids].min(axis=1)
+    nearest[medoids] = -1.0
+    far = [i for i in np.argsort(-nearest, kind="stable") if nearest[i] > outlier_distance]
+    return medoids, np.array(sorted(far[:max_outliers]), dtype=np.int64)
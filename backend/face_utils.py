@@ -1,129 +1,515 @@
 import numpy as np
 import cv2
-import pickle
-import os
-
-# Load DNN face detector (better than Haar Cascades)
-MODEL_FILE = "res10_300x300_ssd_iter_140000.caffemodel"
-CONFIG_FILE = "deploy.prototxt"
-
-# Check if models exist, otherwise use Haar Cascade as fallback
-if os.path.exists(MODEL_FILE) and os.path.exists(CONFIG_FILE):
-    try:
-        face_net = cv2.dnn.readNetFromCaffe(CONFIG_FILE, MODEL_FILE)
-        use_dnn = True
-        print("✓ Using DNN face detector (High Accuracy)")
-    except Exception as e:
-        print(f"⚠ Could not load DNN models: {e}")
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')  # type: ignore
-        use_dnn = False
-        print("✓ Using Haar Cascade detector (Fallback)")
-else:
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')  # type: ignore
-    use_dnn = False
-    print("✓ Using Haar Cascade detector (Run download_models.py for better accuracy)")
-
-# Load eye cascade for liveness detection
-eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')  # type: ignore
-
-def detect_faces_dnn(frame, conf_threshold=0.5):
-    """Detect faces using DNN model (more accurate than Haar Cascade)"""
-    (h, w) = frame.shape[:2]
-    blob = cv2.dnn.blobFromImage(cv2.resize(frame, (300, 300)), 1.0,
-                                 (300, 300), (104.0, 177.0, 123.0))
-    
-    face_net.setInput(blob)
-    detections = face_net.forward()
-    
-    faces = []
-    for i in range(0, detections.shape[2]):
-        confidence = detections[0, 0, i, 2]
-        
-        if confidence > conf_threshold:
-            box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-            (x, y, x2, y2) = box.astype("int")
-            # Ensure coordinates are within frame bounds
-            x, y = max(0, x), max(0, y)
-            x2, y2 = min(w, x2), min(h, y2)
-            faces.append((x, y, x2-x, y2-y))
-    
-    return faces
-
-def compute_lbp(image, radius=1):
-    """Compute Local Binary Pattern for texture analysis"""
-    lbp_image = np.zeros_like(image)
-    
-    for i in range(radius, image.shape[0] - radius):
-        for j in range(radius, image.shape[1] - radius):
-            center = image[i, j]
-            
-            # 8 surrounding pixels
-            pixels = [
-                image[i-radius, j-radius], image[i-radius, j], image[i-radius, j+radius],
-                image[i, j+radius], image[i+radius, j+radius], image[i+radius, j],
-                image[i+radius, j-radius], image[i, j-radius]
-            ]
-            
-            binary_value = 0
-            for idx, pixel in enumerate(pixels):
-                if pixel >= center:
-                    binary_value |= (1 << idx)
-            
-            lbp_image[i, j] = binary_value
-    
-    return lbp_image
+import logging
+import threading
+from collections import namedtuple
+
+import encoding_codec
+from config import Config
+from detection_batcher import DetectionBatcher
+from detector_pool import DetectorPool
+from face_detectors import HaarDetector, scale_box, select_backend
+from face_encoders import select_encoder
+
+logger = logging.getLogger(__name__)
+
+# Face detector backend chosen by Config.FACE_DETECTOR (see face_detectors.py);
+# run download_models.py to fetch the SSD model
+
+# The backend is resolved and its model loaded on first use (or by warm_up), not at import time
+_backend = None
+_spare_detector = None
+_models_lock = threading.Lock()
+
+def detector_backend():
+    """Face detector backend class in use; loads its model on the first call"""
+    global _backend, _spare_detector
+    if _backend is None:
+        with _models_lock:
+            if _backend is None:
+                backend = select_backend(Config.FACE_DETECTOR)
+                try:
+                    # Kept for the first pooled detector so the model is read only once
+                    _spare_detector = backend()
+                except Exception as e:
+                    logger.warning(f"Could not load the {backend.name} face detector: {e}; using Haar Cascade")
+                    backend = HaarDetector
+                    _spare_detector = backend()
+                if backend is HaarDetector and Config.FACE_DETECTOR == "auto":
+                    logger.info(f"Using Haar Cascade detector (no DNN model in {Config.FACE_MODEL_DIR}; "
+                                "run download_models.py for better accuracy)")
+                else:
+                    logger.info(f"Using {backend.name} face detector")
+                _backend = backend
+    return _backend
+
+def _create_detector():
+    """Build one instance of the detector backend for the pool"""
+    global _spare_detector
+    backend = detector_backend()
+    with _models_lock:
+        detector, _spare_detector = _spare_detector, None
+    return detector if detector is not None else backend()
+
+# Instances are created lazily on first checkout
+detector_pool = DetectorPool(_create_detector, Config.DETECTOR_POOL_SIZE)
+
+_detection_batcher = None
+_detection_batcher_lock = threading.Lock()
+
+def get_detection_batcher():
+    """Shared DetectionBatcher when batching is enabled for an SSD backend, else None"""
+    global _detection_batcher
+    if not (Config.DETECT_BATCHING and detector_backend().batchable):
+        return None
+    if _detection_batcher is None:
+        with _detection_batcher_lock:
+            if _detection_batcher is None:
+                # The batcher's worker thread owns a dedicated network
+                _detection_batcher = DetectionBatcher(
+                    _create_detector().net,
+                    max_batch_size=Config.DETECT_BATCH_MAX_SIZE,
+                    max_wait_ms=Config.DETECT_BATCH_MAX_WAIT_MS,
+                )
+    return _detection_batcher
+
+# Face encoder chosen by Config.FACE_ENCODER (see face_encoders.py). Only the class is
+# resolved here, so the web process can read its version and metric without loading a
+# model; instances (and models) are created by the pool in the processes that encode
+_encoder = None
+
+def encoder_backend():
+    """Face encoder class in use; does not load its model"""
+    global _encoder
+    if _encoder is None:
+        with _models_lock:
+            if _encoder is None:
+                encoder = select_encoder(Config.FACE_ENCODER)
+                logger.info(f"Using {encoder.name} face encoder (version {encoder.version})")
+                _encoder = encoder
+    return _encoder
+
+def _create_encoder():
+    """Build one instance of the encoder for the pool"""
+    return encoder_backend()()
+
+encoder_pool = DetectorPool(_create_encoder, Config.DETECTOR_POOL_SIZE)
+
+def encode_face(frame, context):
+    """Encoding of the face at context.face_box from the configured encoder"""
+    with encoder_pool.checkout() as encoder:
+        return encoder.encode(frame, context)
+
+def is_current_encoding(blob):
+    """True if a stored blob was written by the encoder in use
+
+    Encodings from another encoder live in a different space and must not be
+    scored against the gallery; those employees need to register again.
+    """
+    return encoding_codec.encoder_version(blob) == encoder_backend().version
+
+def pipeline_stats():
+    """Detector pool and detection batcher stats of this process; creates neither"""
+    batcher = _detection_batcher
+    return {
+        "detector_pool": detector_pool.stats(),
+        "detection_batcher": batcher.stats() if batcher is not None else None,
+    }
+
+def warm_up():
+    """Load the detector and encoder models now instead of on the first face request"""
+    with detector_pool.checkout():
+        pass
+    with encoder_pool.checkout():
+        pass
+    get_detection_batcher()
+
+def detect_faces(frame, context):
+    """Face boxes (x, y, w, h) in frame coordinates from the configured backend"""
+    backend = detector_backend()
+    batcher = get_detection_batcher()
+    if batcher is not None:
+        return backend.parse(batcher.detect(backend.blob(frame)), frame.shape)
+    with detector_pool.checkout() as detector:
+        return detector.detect(frame, context)
+
+# Neighbour offsets in bit order: clockwise from the top-left pixel
+_LBP_NEIGHBOURS = ((-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1))
+_LBP_BITS = tuple(np.uint8(1 << bit) for bit in range(len(_LBP_NEIGHBOURS)))
+
 
-def create_enhanced_encoding(face_region):
-    """Create robust face encoding using multiple OpenCV techniques"""
-    face_resized = cv2.resize(face_region, (128, 128))
-    gray_face = cv2.cvtColor(face_resized, cv2.COLOR_BGR2GRAY)
-    
-    # 1. Color histograms (LAB color space - better than RGB)
-    lab = cv2.cvtColor(face_resized, cv2.COLOR_BGR2LAB)
-    hist_l = cv2.calcHist([lab], [0], None, [32], [0, 256])
-    hist_a = cv2.calcHist([lab], [1], None, [32], [0, 256])
-    hist_b = cv2.calcHist([lab], [2], None, [32], [0, 256])
-    
-    hist_l = cv2.normalize(hist_l, hist_l).flatten()
-    hist_a = cv2.normalize(hist_a, hist_a).flatten()
-    hist_b = cv2.normalize(hist_b, hist_b).flatten()
-    
-    # 2. HOG features (Histogram of Oriented Gradients)
-    hog = cv2.HOGDescriptor((128, 128), (16, 16), (8, 8), (8, 8), 9)
-    hog_features = hog.compute(gray_face)
-    hog_features = np.array(hog_features).flatten()[:128]
-    
-    # 3. LBP (Local Binary Patterns) - texture features
-    lbp = compute_lbp(gray_face)
-    lbp_hist = cv2.calcHist([lbp], [0], None, [32], [0, 256])
-    lbp_hist = cv2.normalize(lbp_hist, lbp_hist).flatten()
-    
-    # 4. Edge features
-    edges = cv2.Canny(gray_face, 100, 200)
-    edge_hist = cv2.calcHist([edges], [0], None, [16], [0, 256])
-    edge_hist = cv2.normalize(edge_hist, edge_hist).flatten()
-    
-    # Combine all features
-    encoding = np.concatenate([
-        hist_l,        # 32 features
-        hist_a,        # 32 features
-        hist_b,        # 32 features
-        hog_features,  # 128 features
-        lbp_hist,      # 32 features
-        edge_hist      # 16 features
-    ])
-    
-    return encoding
-
-def get_face_encoding(frame):
-    """Extract face encoding from frame with quality checks"""
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    
-    # Use DNN if available, otherwise Haar Cascade
-    if use_dnn:
-        faces = detect_faces_dnn(frame)
+def _build_uniform_lbp_table():
+    """Map each 8-bit LBP code to its uniform-pattern label (58 uniform + 1 catch-all)"""
+    table = np.zeros(256, dtype=np.uint8)
+    label = 0
+    for code in range(256):
+        rotated = ((code << 1) | (code >> 7)) & 0xFF
+        if bin(code ^ rotated).count("1") <= 2:
+            table[code] = label
+            label += 1
+        else:
+            table[code] = 58
+    return table
+
+
+_UNIFORM_LBP_TABLE = _build_uniform_lbp_table()
+
+
+def compute_lbp(image, radius=1, uniform=False, out=None, work=None):
+    """Compute Local Binary Pattern for texture analysis
+
+    Each neighbour comparison is done on a whole shifted slice of the image and
+    packed into one bit of the code image, so the cost is eight array ops
+    instead of a Python loop per pixel. Border pixels are left at zero.
+    Comparisons and the uniform mapping go through OpenCV, which works on the
+    strided slices in place where numpy would allocate iterator buffers.
+
+    Args:
+        uniform: Map codes to uniform-pattern labels (0-57 uniform, 58 other)
+        out: Optional uint8 output image shaped like image, with a zero border
+        work: Optional (codes, mask, bit) uint8 scratch arrays shaped like the
+            image interior
+    """
+    lbp_image = np.zeros_like(image) if out is None else out
+    h, w = image.shape[:2]
+    if h <= 2 * radius or w <= 2 * radius:
+        return lbp_image
+
+    center = image[radius:h - radius, radius:w - radius]
+    if work is None:
+        work = tuple(np.empty(center.shape, dtype=np.uint8) for _ in range(3))
+    codes, mask, bit_values = work
+    codes.fill(0)
+
+    for bit, (dy, dx) in zip(_LBP_BITS, _LBP_NEIGHBOURS):
+        neighbour = image[radius + dy * radius:h - radius + dy * radius,
+                          radius + dx * radius:w - radius + dx * radius]
+        cv2.compare(neighbour, center, cv2.CMP_GE, dst=mask)  # 255 where set
+        np.bitwise_and(mask, bit, out=bit_values)
+        codes |= bit_values
+
+    interior = lbp_image[radius:h - radius, radius:w - radius]
+    if uniform:
+        cv2.LUT(codes, _UNIFORM_LBP_TABLE, dst=interior)
     else:
-        faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(50, 50))
+        np.copyto(interior, codes)
+    return lbp_image
+
+# HOG layout used by create_enhanced_encoding: 16x16 blocks with an 8px
+# stride over 8x8 cells, 9 bins -> 36 values per block. OpenCV orders blocks
+# column by column, so the first HOG_FEATURES values come from the top of
+# the leftmost block column only.
+HOG_FACE_SIZE = (128, 128)
+HOG_BLOCK_SIZE = (16, 16)
+HOG_BLOCK_STRIDE = (8, 8)
+HOG_CELL_SIZE = (8, 8)
+HOG_BINS = 9
+HOG_FEATURES = 128
+
+_HOG_BLOCK_VALUES = (HOG_BLOCK_SIZE[0] // HOG_CELL_SIZE[0]) * (HOG_BLOCK_SIZE[1] // HOG_CELL_SIZE[1]) * HOG_BINS
+_HOG_BLOCKS_NEEDED = -(-HOG_FEATURES // _HOG_BLOCK_VALUES)
+# Window covering just those blocks; one extra pixel right/below keeps the
+# gradients on the window edge identical to the full-image computation
+_HOG_PARTIAL_WINDOW = (HOG_BLOCK_SIZE[0], HOG_BLOCK_SIZE[1] + HOG_BLOCK_STRIDE[1] * (_HOG_BLOCKS_NEEDED - 1))
+_HOG_PARTIAL_CROP = (_HOG_PARTIAL_WINDOW[1] + 1, _HOG_PARTIAL_WINDOW[0] + 1)
+
+_hog_full = None
+_hog_partial = None
+
+
+def compute_hog_features(gray_face, compat=False):
+    """Return the first HOG_FEATURES values of the 128x128 face HOG descriptor
+
+    Only the blocks that contribute to the kept values are computed. The
+    descriptors are built once and reused.
+
+    Args:
+        compat: Compute the full 8100-value descriptor and truncate it, as
+            older versions did. Both modes return identical values.
+    """
+    global _hog_full, _hog_partial
+
+    if compat:
+        if _hog_full is None:
+            _hog_full = cv2.HOGDescriptor(HOG_FACE_SIZE, HOG_BLOCK_SIZE, HOG_BLOCK_STRIDE, HOG_CELL_SIZE, HOG_BINS)
+        return np.asarray(_hog_full.compute(gray_face)).flatten()[:HOG_FEATURES]
+
+    if _hog_partial is None:
+        _hog_partial = cv2.HOGDescriptor(_HOG_PARTIAL_WINDOW, HOG_BLOCK_SIZE, HOG_BLOCK_STRIDE, HOG_CELL_SIZE, HOG_BINS)
+    crop = np.ascontiguousarray(gray_face[:_HOG_PARTIAL_CROP[0], :_HOG_PARTIAL_CROP[1]])
+    features = _hog_partial.compute(crop, HOG_BLOCK_STRIDE, (0, 0), [(0, 0)])
+    return np.asarray(features).flatten()[:HOG_FEATURES]
+
+
+# Layout of create_enhanced_encoding's output: (start, stop) of each feature block
+_LAB_HIST_SLICES = ((0, 32), (32, 64), (64, 96))
+_HOG_SLICE = (96, 96 + HOG_FEATURES)
+_LBP_HIST_SLICE = (224, 256)
+_EDGE_HIST_SLICE = (256, 272)
+ENCODING_DIM = 272
+
+# Largest face (in pixels) whose Laplacian goes in a reused buffer; bigger ones allocate
+_LAPLACIAN_BUFFER_MAX = 512 * 512
+
+
+class EncodingWorkspace:
+    """Preallocated buffers for the handcrafted encoding pipeline
+
+    The resized face, its gray and LAB copies, the LBP and edge images and
+    the HOG input are allocated once; histograms are computed and normalized
+    straight into their slice of the output vector through OpenCV's dst
+    arguments. A steady-state encode() allocates only the HOG descriptor
+    OpenCV returns, plus the output vector when none is passed.
+
+    Not thread-safe: pooled HandcraftedEncoder instances own one each, and
+    create_enhanced_encoding keeps one per thread.
+    """
+
+    def __init__(self):
+        shape = (HOG_FACE_SIZE[1], HOG_FACE_SIZE[0])
+        interior = (shape[0] - 2, shape[1] - 2)
+        self.face = np.empty(shape + (3,), dtype=np.uint8)
+        self.gray = np.empty(shape, dtype=np.uint8)
+        self.lab = np.empty(shape + (3,), dtype=np.uint8)
+        self.lbp = np.zeros(shape, dtype=np.uint8)  # Border stays zero
+        self.lbp_work = tuple(np.empty(interior, dtype=np.uint8) for _ in range(3))
+        self.edges = np.empty(shape, dtype=np.uint8)
+        self.hog_crop = np.empty(_HOG_PARTIAL_CROP, dtype=np.uint8)
+        self.hog = cv2.HOGDescriptor(_HOG_PARTIAL_WINDOW, HOG_BLOCK_SIZE, HOG_BLOCK_STRIDE, HOG_CELL_SIZE, HOG_BINS)
+        self.laplacian = np.empty(0, dtype=np.float64)
+
+    @staticmethod
+    def _histogram(image, channel, out):
+        hist = out.reshape(-1, 1)
+        cv2.calcHist([image], [channel], None, [len(out)], [0, 256], hist=hist)
+        cv2.normalize(hist, hist)
+
+    def encode(self, face_region, out=None):
+        """Same values as create_enhanced_encoding, written into out (float32, ENCODING_DIM)"""
+        if out is None:
+            out = np.empty(ENCODING_DIM, dtype=np.float32)
+        cv2.resize(face_region, HOG_FACE_SIZE, dst=self.face)
+        cv2.cvtColor(self.face, cv2.COLOR_BGR2GRAY, dst=self.gray)
+
+        # 1. Color histograms (LAB color space - better than RGB)
+        cv2.cvtColor(self.face, cv2.COLOR_BGR2LAB, dst=self.lab)
+        for channel, (start, stop) in enumerate(_LAB_HIST_SLICES):
+            self._histogram(self.lab, channel, out[start:stop])
+
+        # 2. HOG features over the blocks that contribute (see compute_hog_features)
+        np.copyto(self.hog_crop, self.gray[:_HOG_PARTIAL_CROP[0], :_HOG_PARTIAL_CROP[1]])
+        features = self.hog.compute(self.hog_crop, HOG_BLOCK_STRIDE, (0, 0), [(0, 0)])
+        out[_HOG_SLICE[0]:_HOG_SLICE[1]] = features.ravel()[:HOG_FEATURES]
+
+        # 3. LBP (Local Binary Patterns) - texture features
+        compute_lbp(self.gray, out=self.lbp, work=self.lbp_work)
+        self._histogram(self.lbp, 0, out[_LBP_HIST_SLICE[0]:_LBP_HIST_SLICE[1]])
+
+        # 4. Edge features
+        cv2.Canny(self.gray, 100, 200, edges=self.edges)
+        self._histogram(self.edges, 0, out[_EDGE_HIST_SLICE[0]:_EDGE_HIST_SLICE[1]])
+        return out
+
+    def laplacian_var(self, gray):
+        """cv2.Laplacian(gray, cv2.CV_64F).var(), computed in a reused buffer"""
+        if gray.size > _LAPLACIAN_BUFFER_MAX:
+            return frame_laplacian_var(gray)
+        if self.laplacian.size < gray.size:
+            self.laplacian = np.empty(_LAPLACIAN_BUFFER_MAX, dtype=np.float64)
+        laplacian = self.laplacian[:gray.size].reshape(gray.shape)
+        cv2.Laplacian(gray, cv2.CV_64F, dst=laplacian)
+        _, std = cv2.meanStdDev(laplacian)
+        return float(std[0, 0]) ** 2
+
+
+def frame_laplacian_var(gray):
+    """cv2.Laplacian(gray, cv2.CV_64F).var() for a large uint8 image
+
+    The 3x3 Laplacian of uint8 pixels fits in int16, which is several times
+    faster to compute and reduce than float64 at full camera resolution.
+    """
+    _, std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_16S))
+    return float(std[0, 0]) ** 2
+
+
+_thread_workspace = threading.local()
+
+
+def encoding_workspace():
+    """The calling thread's EncodingWorkspace"""
+    workspace = getattr(_thread_workspace, "workspace", None)
+    if workspace is None:
+        workspace = _thread_workspace.workspace = EncodingWorkspace()
+    return workspace
+
+
+def create_enhanced_encoding(face_region, out=None):
+    """Create robust face encoding using multiple OpenCV techniques
+
+    Color histograms (LAB), HOG, LBP and edge histograms, 272 values. Runs
+    in the calling thread's EncodingWorkspace.
+
+    Args:
+        out: Optional float32 vector of ENCODING_DIM values to write into
+    """
+    return encoding_workspace().encode(face_region, out)
+
+class FrameContext:
+    """Per-frame cache shared by detection, quality gating, liveness and encoding
+
+    Gray conversion, face ROI statistics and Laplacian variances are computed
+    on first use and reused by every later stage (including the router's
+    quality score), instead of each stage converting the frame again.
+
+    Args:
+        source: Encoded image the frame was decoded from, when decode_frame_scaled shrank it
+        scale: Frame pixels per source pixel (1.0 = decoded at full resolution)
+    """
+
+    def __init__(self, frame, source=None, scale=1.0):
+        self.frame = frame
+        self.source = source
+        self.scale = scale
+        self._source_gray = None
+        self.face_box = None
+        self.face_landmarks = None
+        # Per-face landmark rows (parallel to the detected boxes), set by detectors that have them
+        self.landmarks = None
+        self._gray = None
+        self._frame_stats = None
+        self._frame_laplacian_var = None
+        self._face_laplacian_var = None
+        self._detection_gray = None
+        self._detection_frame = None
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    def detection_gray(self, max_side):
+        """Gray frame shrunk so its long side is at most max_side, and the scale used
+
+        Returns the full-size gray frame and 1.0 when it is already small
+        enough (or max_side is 0).
+        """
+        h, w = self.gray.shape[:2]
+        if not max_side or max(h, w) <= max_side:
+            return self.gray, 1.0
+        if self._detection_gray is None:
+            scale = max_side / max(h, w)
+            size = (max(1, round(w * scale)), max(1, round(h * scale)))
+            self._detection_gray = (cv2.resize(self.gray, size, interpolation=cv2.INTER_AREA), scale)
+        return self._detection_gray
+
+    def detection_frame(self, max_side):
+        """Color counterpart of detection_gray, for detectors that take BGR input"""
+        h, w = self.frame.shape[:2]
+        if not max_side or max(h, w) <= max_side:
+            return self.frame, 1.0
+        if self._detection_frame is None:
+            scale = max_side / max(h, w)
+            size = (max(1, round(w * scale)), max(1, round(h * scale)))
+            self._detection_frame = (cv2.resize(self.frame, size, interpolation=cv2.INTER_AREA), scale)
+        return self._detection_frame
+
+    def set_face(self, face_box, landmarks=None):
+        x, y, w, h = (int(v) for v in face_box)
+        self.face_box = (x, y, w, h)
+        self.face_landmarks = landmarks
+        self._face_laplacian_var = None
+
+    @property
+    def face_region(self):
+        x, y, w, h = self.face_box
+        return self.frame[y:y+h, x:x+w]
+
+    @property
+    def face_gray(self):
+        x, y, w, h = self.face_box
+        return self.gray[y:y+h, x:x+w]
+
+    @property
+    def source_gray(self):
+        """Gray frame at the source resolution; decoded again (luma only) if the frame was shrunk"""
+        if self.source is None or self.scale == 1.0:
+            return self.gray
+        if self._source_gray is None:
+            self._source_gray = cv2.imdecode(np.frombuffer(self.source, np.uint8), cv2.IMREAD_GRAYSCALE)
+        return self._source_gray
+
+    @property
+    def source_face_gray(self):
+        """face_gray at the source resolution"""
+        gray = self.source_gray
+        if gray is self.gray:
+            return self.face_gray
+        x, y, w, h = scale_box(self.face_box, 1.0 / self.scale, gray.shape)
+        return gray[y:y+h, x:x+w]
+
+    @property
+    def face_brightness(self):
+        return float(np.mean(self.face_gray))
+
+    @property
+    def face_laplacian_var(self):
+        # Sharpness does not survive downscaling (a blurry frame reads sharp once shrunk),
+        # so it is measured at the source resolution the blur and liveness thresholds assume
+        if self._face_laplacian_var is None:
+            self._face_laplacian_var = encoding_workspace().laplacian_var(self.source_face_gray)
+        return self._face_laplacian_var
+
+    @property
+    def frame_brightness(self):
+        return self._frame_mean_std()[0]
+
+    @property
+    def frame_contrast(self):
+        return self._frame_mean_std()[1]
+
+    def _frame_mean_std(self):
+        if self._frame_stats is None:
+            mean, std = cv2.meanStdDev(self.gray)
+            self._frame_stats = (float(mean[0][0]), float(std[0][0]))
+        return self._frame_stats
+
+    @property
+    def quality_score(self):
+        """Whole-frame sharpness score stored with training samples"""
+        if self._frame_laplacian_var is None:
+            self._frame_laplacian_var = frame_laplacian_var(self.source_gray)
+        return self._frame_laplacian_var / 1000.0
+
+
+def check_frame(context):
+    """Cheap whole-frame rejections that run before the face detector"""
+    h, w = context.frame.shape[:2]
+    # Size limits are in source pixels; brightness and contrast do not depend on scale
+    if h < 60 * context.scale or w < 60 * context.scale:
+        return ["Image too small. Please move closer to the camera"]
+    if context.frame_brightness < 10:
+        return ["Image too dark. Please improve lighting"]
+    if context.frame_contrast < 3:
+        return ["No face detected"]
+    return []
+
+
+def get_face_encoding(frame, context=None):
+    """Extract face encoding from frame with quality checks
+
+    Args:
+        context: Optional FrameContext for the frame; pass one to reuse its
+            gray image and statistics after the call (e.g. quality_score)
+    """
+    if context is None:
+        context = FrameContext(frame)
+    
+    frame_issues = check_frame(context)
+    if frame_issues:
+        return None, frame_issues
+    
+    faces = detect_faces(frame, context)
     
     if len(faces) == 0:
         return None, ["No face detected"]
@@ -131,62 +517,235 @@ def get_face_encoding(frame):
     if len(faces) > 1:
         return None, ["Multiple faces detected. Please ensure only one person is in frame"]
     
-    # Get face region
-    x, y, w, h = faces[0]
-    face_region = frame[y:y+h, x:x+w]
+    # Get face region (and landmarks, from detectors that report them)
+    context.set_face(faces[0], context.landmarks[0] if context.landmarks else None)
+    face_region = context.face_region
     
     # Check face quality
-    quality_issues = check_face_quality(face_region)
+    quality_issues = check_face_quality(face_region, context)
     if quality_issues:
         return None, quality_issues
     
     # Check liveness (basic anti-spoofing)
-    is_live, liveness_msg = detect_basic_liveness(frame, (x, y, w, h))
+    is_live, liveness_msg = detect_basic_liveness(frame, context.face_box, context)
     if not is_live:
         return None, [liveness_msg]
     
-    # Create enhanced face encoding
-    encoding = create_enhanced_encoding(face_region)
+    encoding = encode_face(frame, context)
     
     return encoding, []
 
-def check_face_quality(face_img):
+def get_face_encodings(frame, context=None, max_faces=None):
+    """Group variant of get_face_encoding: encode every face in the frame
+
+    Faces are taken largest first (at most max_faces). Each gets the same
+    quality and liveness checks as a single capture, and the ones that pass
+    are encoded together in one encoder checkout.
+
+    Returns:
+        ([(face_box, encoding or None, issues), ...], frame issues)
+    """
+    if context is None:
+        context = FrameContext(frame)
+    
+    frame_issues = check_frame(context)
+    if frame_issues:
+        return [], frame_issues
+    
+    faces = detect_faces(frame, context)
+    if len(faces) == 0:
+        return [], ["No face detected"]
+    
+    landmarks = context.landmarks or [None] * len(faces)
+    order = sorted(range(len(faces)), key=lambda i: faces[i][2] * faces[i][3], reverse=True)[:max_faces]
+    results = []
+    passed = []
+    for i in order:
+        context.set_face(faces[i], landmarks[i])
+        issues = check_face_quality(context.face_region, context)
+        if not issues:
+            is_live, liveness_msg = detect_basic_liveness(frame, context.face_box, context)
+            if not is_live:
+                issues = [liveness_msg]
+        if not issues:
+            passed.append((len(results), landmarks[i]))
+        results.append((context.face_box, None, issues))
+    
+    if passed:
+        with encoder_pool.checkout() as encoder:
+            encodings = encoder.encode_many(frame, context, [(results[j][0], marks) for j, marks in passed])
+        for (j, _), encoding in zip(passed, encodings):
+            results[j] = (results[j][0], encoding, [])
+    return results, []
+
+# JPEG start-of-frame markers (SOF0-SOF15 except DHT, JPG and DAC)
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def _jpeg_size(data):
+    """(width, height) from a JPEG's frame header without decoding, or None"""
+    if data[:2] != b"\xff\xd8":
+        return None
+    i, n = 2, len(data)
+    while i + 9 <= n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # Fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # Markers without a length
+            i += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+_REDUCED_DECODE_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+def decode_frame_scaled(img_bytes, max_side=None):
+    """Decode an encoded image to BGR with its long side capped at max_side
+
+    JPEGs at least twice the cap are decoded at 1/2, 1/4 or 1/8 scale by the
+    JPEG decoder itself (IMREAD_REDUCED_*), which is much cheaper than a full
+    decode followed by a resize; what remains above the cap is resized away.
+
+    Args:
+        max_side: Longest allowed side in pixels; defaults to Config.MAX_FRAME_SIDE, 0 = no limit
+
+    Returns:
+        (frame or None, frame pixels per source pixel); pass both and the bytes
+        to FrameContext so quality gates keep their source-resolution meaning
+    """
+    if max_side is None:
+        max_side = Config.MAX_FRAME_SIDE
+    flags = cv2.IMREAD_COLOR
+    factor = 1
+    size = _jpeg_size(img_bytes) if max_side else None
+    if size:
+        for reduced_factor, reduced_flag in _REDUCED_DECODE_FLAGS:
+            if max(size) // reduced_factor >= max_side:
+                flags, factor = reduced_flag, reduced_factor
+                break
+    
+    frame = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), flags)
+    if frame is None:
+        return None, 1.0
+    h, w = frame.shape[:2]
+    source_side = max(size) if size else max(h, w) * factor
+    if max_side and max(h, w) > max_side:
+        scale = max_side / max(h, w)
+        frame = cv2.resize(frame, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    return frame, max(frame.shape[:2]) / source_side
+
+def decode_frame(img_bytes, max_side=None):
+    """decode_frame_scaled without the scale"""
+    return decode_frame_scaled(img_bytes, max_side)[0]
+
+def frame_context(img_bytes):
+    """FrameContext for an encoded image (decoded by decode_frame_scaled), or None if it does not decode"""
+    frame, scale = decode_frame_scaled(img_bytes)
+    if frame is None:
+        return None
+    return FrameContext(frame, img_bytes if scale != 1.0 else None, scale)
+
+# Picklable result of encode_image_bytes; error is set when the image could not be decoded,
+# thumbnail holds a JPEG of the face crop when Config.FACE_THUMBNAIL_SIZE is set, and
+# replayed is set by callers serving the result from the encoding cache
+FaceResult = namedtuple(
+    "FaceResult", ["encoding", "issues", "face_box", "quality_score", "error", "thumbnail", "replayed"],
+    defaults=(False,),
+)
+
+# encode_image_faces result: a FaceResult per face (largest first), or frame-level issues / error
+GroupResult = namedtuple("GroupResult", ["faces", "issues", "error"])
+
+
+def _face_thumbnail(context):
+    """JPEG crop of context.face_box at FACE_THUMBNAIL_SIZE, or None when disabled"""
+    if not Config.FACE_THUMBNAIL_SIZE or context.face_box is None:
+        return None
+    size = Config.FACE_THUMBNAIL_SIZE
+    crop = cv2.resize(context.face_region, (size, size), interpolation=cv2.INTER_AREA)
+    return cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def encode_image_bytes(img_bytes):
+    """Decode an encoded image (JPEG/PNG bytes) and run get_face_encoding on it
+
+    Module-level and returning only small picklable values, so face_workers
+    can run it in a worker process without shipping frames back.
+    """
+    context = frame_context(img_bytes)
+    if context is None:
+        return FaceResult(None, [], None, 0.0, "Failed to decode image", None)
+    
+    encoding, issues = get_face_encoding(context.frame, context)
+    if encoding is None:
+        return FaceResult(None, issues, None, 0.0, None, None)
+    
+    return FaceResult(encoding, [], context.face_box, context.quality_score, None, _face_thumbnail(context))
+
+def encode_image_faces(img_bytes, max_faces=None):
+    """Group variant of encode_image_bytes: run get_face_encodings on an encoded image"""
+    context = frame_context(img_bytes)
+    if context is None:
+        return GroupResult([], [], "Failed to decode image")
+    
+    faces, issues = get_face_encodings(context.frame, context, max_faces)
+    results = []
+    for face_box, encoding, face_issues in faces:
+        context.set_face(face_box)
+        thumbnail = _face_thumbnail(context) if encoding is not None else None
+        results.append(FaceResult(encoding, face_issues, face_box, context.quality_score, None, thumbnail))
+    return GroupResult(results, issues, None)
+
+def check_face_quality(face_img, context=None):
     """Check if face image quality is good enough for recognition"""
     issues = []
     
-    # Check face size (should be at least 60x60 pixels - more lenient)
-    if face_img.shape[0] < 60 or face_img.shape[1] < 60:
+    # Check face size (should be at least 60x60 source pixels - more lenient)
+    min_side = 60 * context.scale if context is not None else 60
+    if face_img.shape[0] < min_side or face_img.shape[1] < min_side:
         issues.append("Face too small. Please move closer to the camera")
     
     # Check brightness
-    gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY)
-    brightness = np.mean(gray)
+    if context is not None:
+        brightness = context.face_brightness
+        laplacian_var = context.face_laplacian_var
+    else:
+        gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY)
+        brightness = np.mean(gray)
+        laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
     if brightness < 30:
         issues.append("Image too dark. Please improve lighting")
     elif brightness > 240:
         issues.append("Image too bright. Please reduce lighting")
     
     # Check blur using Laplacian variance (more lenient threshold)
-    laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
     if laplacian_var < 30:
         issues.append("Image is blurry. Please hold camera steady")
     
     return issues
 
-def detect_basic_liveness(frame, face_coords):
+def detect_basic_liveness(frame, face_coords, context=None):
     """Basic liveness detection - simplified for better usability"""
     x, y, w, h = face_coords
     face_region = frame[y:y+h, x:x+w]
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    gray_face = gray[y:y+h, x:x+w]
     
     # 1. Check image sharpness (photos on screens have unusual sharpness)
-    laplacian_var = cv2.Laplacian(gray_face, cv2.CV_64F).var()
+    if context is not None:
+        laplacian_var = context.face_laplacian_var
+    else:
+        gray_face = cv2.cvtColor(face_region, cv2.COLOR_BGR2GRAY)
+        laplacian_var = cv2.Laplacian(gray_face, cv2.CV_64F).var()
     if laplacian_var > 3000:
         return False, "Image quality suspicious. Please use direct camera capture"
     
     # 2. Color distribution check (photos have different color distribution)
-    color_std = np.std(face_region, axis=(0, 1))
+    _, color_std = cv2.meanStdDev(face_region)
     if np.mean(color_std) < 3:
         return False, "Color distribution suspicious"
     
@@ -198,6 +757,10 @@ def compare_faces(known_encoding, unknown_encoding, tolerance=0.5):
     Args:
         tolerance: Higher = more lenient (0.5 = 50% confidence required)
     """
+    if encoder_backend().metric == "cosine":
+        confidence = float(score_encodings(known_encoding, unknown_encoding)[0])
+        return confidence >= (1.0 - tolerance), confidence
+
     # Calculate multiple distance metrics for robust matching
     
     # 1. Euclidean distance (L2 norm)
@@ -235,24 +798,199 @@ def compare_faces(known_encoding, unknown_encoding, tolerance=0.5):
     return match, confidence
 
 
+def encoding_stats(matrix):
+    """Precompute per-row statistics used by score_encodings
+
+    Returns:
+        (row L2 norms, L2 norms of the mean-centred rows), both float64
+    """
+    rows = np.asarray(matrix, dtype=np.float64)
+    if rows.ndim == 1:
+        rows = rows.reshape(1, -1)
+    if rows.shape[0] == 0:
+        return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64)
+    norms = np.sqrt(np.einsum("ij,ij->i", rows, rows))
+    centered = rows - rows.mean(axis=1, keepdims=True)
+    centered_norms = np.sqrt(np.einsum("ij,ij->i", centered, centered))
+    return norms, centered_norms
+
+
+# Rows of a reduced-precision matrix widened to float32 at a time (~0.5 MB, stays in cache)
+_SCORE_BLOCK_ROWS = 512
+
+
+def pack_encodings(matrix, precision="float32"):
+    """Convert an (N x D) encoding matrix to a gallery storage precision
+
+    float16 halves and int8 quarters the memory of float32; score_encodings
+    reads either directly. Statistics are computed on the stored (rounded)
+    values so scores stay self-consistent.
+
+    Args:
+        precision: "float32", "float16" or "int8" (symmetric, one scale per row)
+
+    Returns:
+        (values, stats) where stats is encoding_stats of the stored values,
+        plus the int8 per-row scales as a third element
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    if precision == "float32":
+        return matrix, encoding_stats(matrix)
+    if precision == "float16":
+        values = matrix.astype(np.float16)
+        return values, encoding_stats(values)
+    if precision == "int8":
+        values, scales = encoding_codec.quantize_int8(matrix)
+        return values, encoding_stats(unpack_encodings(values, scales)) + (scales,)
+    raise ValueError(f"Unknown encoding precision '{precision}'")
+
+
+def unpack_encodings(values, scales=None):
+    """float32 copy of rows stored by pack_encodings"""
+    rows = np.asarray(values).astype(np.float32)
+    if scales is not None:
+        rows *= np.asarray(scales, dtype=np.float32).reshape(-1, 1)
+    return rows
+
+
+def _distance_terms(matrix, probes, dots):
+    """Euclidean and Manhattan distances (N x P) plus the products with every column of dots"""
+    euclidean_dist = np.empty((len(matrix), len(probes)))
+    manhattan_dist = np.empty((len(matrix), len(probes)))
+    for j, probe in enumerate(probes):
+        # Distance metrics need the per-element difference
+        diff = matrix - probe
+        euclidean_dist[:, j] = np.sqrt(np.einsum("ij,ij->i", diff, diff, dtype=np.float64))
+        np.abs(diff, out=diff)
+        manhattan_dist[:, j] = diff.sum(axis=1, dtype=np.float64)
+
+    # Similarity metrics for every probe are a single matrix-matrix product
+    products = (matrix @ dots).astype(np.float64)
+    return euclidean_dist, manhattan_dist, products
+
+
+def _blockwise(terms, matrix, scales, reduced):
+    """Apply terms(rows) to a float32 matrix, or to reduced-precision rows widened block by block"""
+    if not reduced:
+        return terms(matrix)
+    blocks = [
+        terms(unpack_encodings(matrix[start:start + _SCORE_BLOCK_ROWS],
+                               None if scales is None else scales[start:start + _SCORE_BLOCK_ROWS]))
+        for start in range(0, len(matrix), _SCORE_BLOCK_ROWS)
+    ]
+    return tuple(np.concatenate(part) for part in zip(*blocks))
+
+
+def score_encodings(matrix, unknown_encoding, stats=None):
+    """Score one probe against every row of an (N x D) encoding matrix at once
+
+    Produces the same fused confidence as compare_faces for each row (for a
+    cosine encoder such as SFace, its rescaled cosine similarity). Cosine
+    and correlation reduce to one matrix-vector product: since the centred
+    probe sums to zero, row . centred_probe equals centred_row . centred_probe.
+    float16 and int8 matrices (see pack_encodings) are widened to float32
+    block by block, so the full-precision matrix never exists in memory.
+
+    Args:
+        stats: Optional (norms, centered_norms) from encoding_stats(matrix),
+            or the stats from pack_encodings (required for int8)
+
+    Returns:
+        float64 array of N confidences in [0, 1]
+    """
+    probe = np.asarray(unknown_encoding).reshape(1, -1)
+    return score_encodings_many(matrix, probe, stats)[0]
+
+
+def score_encodings_many(matrix, probes, stats=None):
+    """score_encodings for several probes (P x D) at once
+
+    The similarity terms of all probes come from one matrix-matrix product;
+    the fused metric's Euclidean and Manhattan distances are still taken
+    probe by probe.
+
+    Returns:
+        float64 (P x N) array of confidences in [0, 1]
+    """
+    matrix = np.asarray(matrix)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    probes = np.asarray(probes)
+    if matrix.shape[0] == 0:
+        return np.empty((len(probes), 0), dtype=np.float64)
+    if stats is None:
+        stats = encoding_stats(matrix)
+    norms, centered_norms = stats[:2]
+    scales = stats[2] if len(stats) > 2 else None
+    reduced = scales is not None or matrix.dtype == np.float16
+
+    probes = probes.astype(np.float32 if reduced else matrix.dtype, copy=False)
+    probe_norms = np.linalg.norm(probes.astype(np.float64), axis=1)
+
+    encoder = encoder_backend()
+    if encoder.metric == "cosine":
+        # Learned embeddings use a single cosine metric; only the dot products are needed
+        (products,) = _blockwise(lambda rows: ((rows @ probes.T).astype(np.float64),), matrix, scales, reduced)
+        return encoder.confidence(products / (norms[:, None] * probe_norms + 1e-10)).T
+
+    probes_centered = probes - probes.mean(axis=1, keepdims=True)
+    probe_centered_norms = np.linalg.norm(probes_centered.astype(np.float64), axis=1)
+    dots = np.ascontiguousarray(np.concatenate([probes, probes_centered]).T)
+
+    euclidean_dist, manhattan_dist, products = _blockwise(
+        lambda rows: _distance_terms(rows, probes, dots), matrix, scales, reduced
+    )
+    count = len(probes)
+    cosine_sim = products[:, :count] / (norms[:, None] * probe_norms + 1e-10)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = products[:, count:] / (centered_norms[:, None] * probe_centered_norms)
+    corr = np.nan_to_num(np.clip(corr, -1.0, 1.0), nan=0.0)
+
+    euclidean_normalized = 1.0 / (1.0 + euclidean_dist / 100.0)
+    manhattan_normalized = 1.0 / (1.0 + manhattan_dist / 1000.0)
+
+    confidence = (
+        0.35 * euclidean_normalized +
+        0.40 * cosine_sim +
+        0.15 * manhattan_normalized +
+        0.10 * corr
+    )
+    return np.clip(confidence, 0.0, 1.0).T
+
+
+def fuse_scores(confidences, owners):
+    """Segmented best/mean fusion of row confidences per owner
+
+    Rows sharing an owner id are reduced the same way compare_faces_multi
+    reduces one employee's samples.
+
+    Returns:
+        (sorted unique owner ids, best confidence per owner, fused confidence per owner)
+    """
+    owner_ids, inverse, counts = np.unique(owners, return_inverse=True, return_counts=True)
+    best = np.full(len(owner_ids), -np.inf)
+    np.maximum.at(best, inverse, confidences)
+    mean = np.bincount(inverse, weights=confidences, minlength=len(owner_ids)) / np.maximum(counts, 1)
+    return owner_ids, best, 0.7 * best + 0.3 * mean
+
+
 def compare_faces_multi(known_encodings, unknown_encoding, tolerance=0.5):
     """Compare unknown face against multiple known encodings
     
     Uses best match and average confidence from all samples for better accuracy.
     """
-    if not known_encodings:
+    if len(known_encodings) == 0:
         return False, 0.0
     
-    confidences = []
-    for known_enc in known_encodings:
-        _, conf = compare_faces(known_enc, unknown_encoding, tolerance)
-        confidences.append(conf)
+    confidences = score_encodings(np.asarray(known_encodings), unknown_encoding)
     
     # Use maximum confidence (best match)
-    best_confidence = max(confidences)
+    best_confidence = float(confidences.max())
     
     # Also consider average confidence for consistency
-    avg_confidence = np.mean(confidences)
+    avg_confidence = float(confidences.mean())
     
     # Final confidence: weighted combination
     final_confidence = 0.7 * best_confidence + 0.3 * avg_confidence
@@ -263,9 +1001,17 @@ def compare_faces_multi(known_encodings, unknown_encoding, tolerance=0.5):
     return match, float(final_confidence)
 
 def encoding_to_bytes(encoding):
-    """Convert numpy array to bytes for database storage"""
-    return pickle.dumps(encoding)
+    """Convert numpy array to bytes for database storage (tagged with the encoder version)"""
+    return encoding_codec.encode(encoding, encoder_backend().version, Config.ENCODING_STORAGE)
 
 def bytes_to_encoding(encoding_bytes):
-    """Convert bytes back to numpy array"""
-    return pickle.loads(encoding_bytes)
+    """Convert bytes back to numpy array (accepts legacy pickled rows)"""
+    return encoding_codec.decode(encoding_bytes)[0]
+
+def encodings_to_bytes(encodings):
+    """Pack several encodings (e.g. all samples of one employee) into one blob"""
+    return encoding_codec.encode(np.asarray(encodings), encoder_backend().version, Config.ENCODING_STORAGE)
+
+def bytes_to_encodings(encoding_bytes):
+    """Unpack a blob into a (count x dim) matrix without copying"""
+    return encoding_codec.decode(encoding_bytes)
@@ -0,0 +1,169 @@
+"""Dedicated process pool for CPU-bound face work
+
+Decoding, detection and encoding hold the GIL for their Python parts, so
+running them on Starlette's shared threadpool starves cheap DB-only
+endpoints during a check-in rush. FaceWorkerPool runs that work in its own
+worker processes behind a bounded queue: once `max_queue` requests are
+waiting for a worker, further requests are rejected instead of piling up.
+
+With `workers=0` the work runs inline on the request threadpool (useful for
+development and tests), still subject to the same queue bound.
+
+Detector pool and batcher stats live in the process that runs the face work,
+so every call returns a snapshot of its worker's stats alongside the result.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from starlette.concurrency import run_in_threadpool
+
+from config import Config
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class FaceWorkersBusy(RuntimeError):
+    """Raised when the face worker queue is full"""
+
+
+class FaceWorkersRestarting(FaceWorkersBusy):
+    """Raised for calls lost when a worker process died; the pool is restarted"""
+
+
+def _init_worker():
+    """Load detectors once per worker and keep OpenCV from oversubscribing cores"""
+    import cv2
+    cv2.setNumThreads(1)
+    import face_utils
+    face_utils.warm_up()
+
+
+def _timed_call(fn, args, submitted_at):
+    import face_utils
+    # time.monotonic is system-wide on the supported platforms, so the
+    # queue wait can be measured across the process boundary
+    started = time.monotonic()
+    result = fn(*args)
+    ran = time.monotonic() - started
+    return result, started - submitted_at, ran, os.getpid(), face_utils.pipeline_stats()
+
+
+class FaceWorkerPool:
+    """Bounded process pool for face pipeline calls
+
+    Args:
+        workers: Worker processes; 0 runs calls inline on the threadpool
+        max_queue: Calls allowed to wait for a busy worker before rejecting
+    """
+
+    def __init__(self, workers, max_queue):
+        self.workers = max(0, workers)
+        self.max_queue = max(0, max_queue)
+        self.capacity = max(1, self.workers) + self.max_queue
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+        self.restarts = 0
+        # pid -> latest face_utils.pipeline_stats() reported by that worker
+        self._worker_stats = {}
+        self.queue_wait_ms = Histogram([1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500])
+        self.run_ms = Histogram([10, 25, 50, 100, 250, 500, 1000, 2500])
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the server process has running threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+            return self._executor
+
+    def start(self):
+        """Start the worker processes ahead of the first request"""
+        if self.workers:
+            executor = self._get_executor()
+            for _ in range(self.workers):
+                executor.submit(time.sleep, 0)
+
+    def _restart(self, executor):
+        """Replace a broken executor (once, however many calls saw it break)"""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self.restarts += 1
+            self._worker_stats.clear()
+        logger.error("Face worker process died; restarting the pool")
+        executor.shutdown(wait=False)
+        self.start()
+
+    async def run(self, fn, *args):
+        """Run `fn(*args)` on a worker; `fn` and its arguments must be picklable
+
+        Raises:
+            FaceWorkersBusy: If the queue is already full
+            FaceWorkersRestarting: If a worker process died during the call
+        """
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected += 1
+                raise FaceWorkersBusy("Face worker queue is full")
+            self._pending += 1
+
+        try:
+            submitted_at = time.monotonic()
+            if self.workers:
+                executor = self._get_executor()
+                try:
+                    result, waited, ran, pid, worker_stats = await asyncio.get_running_loop().run_in_executor(
+                        executor, _timed_call, fn, args, submitted_at
+                    )
+                except BrokenProcessPool:
+                    self._restart(executor)
+                    raise FaceWorkersRestarting("Face worker process died")
+            else:
+                result, waited, ran, pid, worker_stats = await run_in_threadpool(
+                    _timed_call, fn, args, submitted_at
+                )
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+        self.queue_wait_ms.observe(waited * 1000.0)
+        self.run_ms.observe(ran * 1000.0)
+        self._worker_stats[pid] = worker_stats
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        pending = self._pending
+        return {
+            "mode": "process" if self.workers else "inline",
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "pending": pending,
+            "queued": max(0, pending - max(1, self.workers)),
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            "run_ms": self.run_ms.snapshot(),
+            "per_worker": {str(pid): stats for pid, stats in list(self._worker_stats.items())},
+        }
+
+
+face_worker_pool = FaceWorkerPool(Config.FACE_WORKERS, Config.FACE_QUEUE_MAX)
@@ -1,14 +1,17 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import cv2
-import numpy as np
 import base64
 from datetime import datetime, date
 import os
 import logging
 from database import Session, engine, Base
 from models import Employee, Attendance
-from face_utils import get_face_encoding, compare_faces, encoding_to_bytes, bytes_to_encoding
+from face_utils import (
+    get_face_encoding, compare_faces, encoding_to_bytes, bytes_to_encoding, frame_context, is_current_encoding,
+)
+from face_gallery import get_gallery
+from attendance_state import get_attendance_state
 from config import Config
 
 # Configure logging
@@ -84,15 +87,14 @@ def register_face():
         # Decode base64 image
         try:
             image_data = base64.b64decode(image_base64.split(',')[1] if ',' in image_base64 else image_base64)
-            nparr = np.frombuffer(image_data, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            if frame is None:
+            context = frame_context(image_data)
+            if context is None:
                 return jsonify({"error": "Failed to decode image"}), 400
         except Exception as e:
             return jsonify({"error": f"Invalid image format: {str(e)}"}), 400
         
         # Get face encoding with quality checks
-        result = get_face_encoding(frame)
+        result = get_face_encoding(context.frame, context)
         if result is None:
             return jsonify({"error": "No face detected"}), 400
         
@@ -116,6 +118,7 @@ def register_face():
             session.add(employee)
             session.commit()
             session.refresh(employee)
+            get_gallery().set_primary(employee, encoding)
             
             logger.info(f"Employee registered: {employee.name} (ID: {employee.id})")
             
@@ -145,15 +148,14 @@ def mark_attendance():
         # Decode base64 image
         try:
             image_data = base64.b64decode(image_base64.split(',')[1] if ',' in image_base64 else image_base64)
-            nparr = np.frombuffer(image_data, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            if frame is None:
+            context = frame_context(image_data)
+            if context is None:
                 return jsonify({"error": "Failed to decode image"}), 400
         except Exception as e:
             return jsonify({"error": f"Invalid image format: {str(e)}"}), 400
         
         # Get face encoding
-        result = get_face_encoding(frame)
+        result = get_face_encoding(context.frame, context)
         if result is None:
             return jsonify({"error": "No face detected"}), 400
         
@@ -172,6 +174,9 @@ def mark_attendance():
             best_confidence = 0
             
             for employee in employees:
+                # Registered with a different face encoder; not comparable
+                if not is_current_encoding(employee.face_encoding):
+                    continue
                 stored_encoding = bytes_to_encoding(employee.face_encoding)
                 is_match, confidence = compare_faces(stored_encoding, encoding)
                 
@@ -200,7 +205,7 @@ def mark_attendance():
             timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
             image_filename = f"{best_match.id}_{timestamp_str}.jpg"
             image_path = os.path.join(UPLOAD_DIR, image_filename)
-            cv2.imwrite(image_path, frame)
+            cv2.imwrite(image_path, context.frame)
             
             # Mark attendance
             attendance = Attendance(
@@ -211,6 +216,7 @@ def mark_attendance():
             )
             session.add(attendance)
             session.commit()
+            get_attendance_state().invalidate(best_match.id)
             
             return jsonify({
                 "message": "Attendance marked successfully",
@@ -290,6 +296,8 @@ def delete_employee(employee_id):
             session.query(Attendance).filter_by(employee_id=employee_id).delete()
             session.delete(employee)
             session.commit()
+            get_gallery().remove_employee(employee_id)
+            get_attendance_state().invalidate(employee_id)
             
             return jsonify({"message": "Employee deleted successfully"}), 200
         finally:
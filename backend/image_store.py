@@ -0,0 +1,181 @@
+"""Background persistence of attendance images
+
+Check-in handlers decide the final path synchronously (so the attendance row
+can store it) and hand the uploaded bytes to an ImageWriter, whose thread
+writes them off the request path. Files are sharded by date and employee:
+
+    UPLOAD_DIR/YYYY/MM/DD/<employee_id>/<action>_<HHMMSS_micro>.<ext>
+
+Failed writes are retried with backoff. A write that still fails is spooled
+to a fallback directory under the same relative path, so the path on the
+attendance row stays valid once the spool is moved back; that happens when
+the writer starts and after each later successful write. The queue is
+drained on shutdown.
+"""
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+from config import Config
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def image_extension(data):
+    """File extension for encoded image bytes, from their magic number"""
+    if data[:3] == b"\xff\xd8\xff":
+        return ".jpg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return ".png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    return ".bin"
+
+
+class ImageWriter:
+    """Writes image files on a background thread
+
+    Args:
+        root: Base directory for the sharded image tree
+        spool_dir: Fallback directory for writes that keep failing under root
+        max_retries: Extra attempts for a failing write before it is spooled
+        retry_delay: Seconds before the first retry; doubles on each attempt
+    """
+
+    def __init__(self, root, spool_dir=None, max_retries=5, retry_delay=0.2):
+        self.root = root
+        self.spool_dir = spool_dir
+        self.max_retries = max(0, max_retries)
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        # Files may be left in the spool by an earlier run
+        self._spool_pending = spool_dir is not None
+        self.written = 0
+        self.retries = 0
+        self.spooled = 0
+        self.restored = 0
+        self.failed = 0
+        self.write_ms = Histogram([1, 5, 10, 25, 50, 100, 250, 1000])
+
+    def path_for(self, employee_id, action, when, data):
+        """Final path for an employee's image taken at `when`"""
+        directory = os.path.join(self.root, when.strftime("%Y"), when.strftime("%m"), when.strftime("%d"), str(employee_id))
+        return os.path.join(directory, f"{action}_{when.strftime('%H%M%S_%f')}{image_extension(data)}")
+
+    @staticmethod
+    def thumbnail_path(image_path):
+        return os.path.splitext(image_path)[0] + "_face.jpg"
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._start_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name="image-writer", daemon=True)
+                    self._worker.start()
+
+    def submit(self, path, data):
+        """Queue `data` to be written to `path`; returns immediately"""
+        self._ensure_worker()
+        self._queue.put((path, data))
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary name first so readers never see a partial file
+        tmp_path = path + ".part"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _spool_path(self, path):
+        return os.path.join(self.spool_dir, os.path.relpath(path, self.root))
+
+    def _spool(self, path, data, error):
+        """Keep a write that failed under root in the spool directory"""
+        if self.spool_dir is not None:
+            try:
+                self._write(self._spool_path(path), data)
+                self._spool_pending = True
+                self.spooled += 1
+                logger.error(f"Writing {path} failed after {self.max_retries + 1} attempts ({error}); spooled")
+                return
+            except OSError as e:
+                error = e
+        self.failed += 1
+        logger.error(f"Giving up writing {path} after {self.max_retries + 1} attempts: {error}")
+
+    def _restore_spool(self):
+        """Move spooled images back to their paths under root; stops at the first failure"""
+        self._spool_pending = False
+        for directory, _, names in os.walk(self.spool_dir):
+            for name in names:
+                if name.endswith(".part"):
+                    continue
+                spooled = os.path.join(directory, name)
+                path = os.path.join(self.root, os.path.relpath(spooled, self.spool_dir))
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    shutil.move(spooled, path)
+                except OSError as e:
+                    self._spool_pending = True
+                    logger.warning(f"Could not restore spooled image {spooled}: {e}")
+                    return
+                self.restored += 1
+
+    def _run(self):
+        if self._spool_pending:
+            self._restore_spool()
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                path, data = job
+                started = time.perf_counter()
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        self._write(path, data)
+                        self.written += 1
+                        if self._spool_pending:
+                            # The root is writable again
+                            self._restore_spool()
+                        break
+                    except OSError as e:
+                        if attempt == self.max_retries:
+                            self._spool(path, data, e)
+                        else:
+                            self.retries += 1
+                            logger.warning(f"Writing {path} failed ({e}); retrying")
+                            time.sleep(self.retry_delay * (2 ** attempt))
+                self.write_ms.observe((time.perf_counter() - started) * 1000.0)
+            finally:
+                self._queue.task_done()
+
+    def shutdown(self, timeout=30.0):
+        """Drain the queue and stop the writer thread"""
+        if self._worker is not None and self._worker.is_alive():
+            self._queue.put(_STOP)
+            self._worker.join(timeout)
+            if self._worker.is_alive():
+                logger.error(f"Image writer still busy after {timeout}s; {self._queue.qsize()} images not written")
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "retries": self.retries,
+            "spooled": self.spooled,
+            "restored": self.restored,
+            "failed": self.failed,
+            "write_ms": self.write_ms.snapshot(),
+        }
+
+
+image_writer = ImageWriter(Config.UPLOAD_DIR, Config.IMAGE_SPOOL_DIR, Config.IMAGE_WRITE_RETRIES)
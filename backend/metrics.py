@@ -0,0 +1,43 @@
+"""Lightweight in-process metrics for tuning the face pipeline"""
+import bisect
+import threading
+
+
+class Histogram:
+    """Thread-safe cumulative histogram with fixed bucket upper bounds
+
+    Snapshots use the Prometheus convention: each bucket counts observations
+    less than or equal to its bound, and "+Inf" counts everything.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = sorted(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+
+        buckets = {}
+        running = 0
+        for bound, bucket_count in zip(self.bounds, counts):
+            running += bucket_count
+            buckets[str(bound)] = running
+        buckets["+Inf"] = count
+        return {
+            "count": count,
+            "sum": round(total, 6),
+            "mean": round(total / count, 6) if count else None,
+            "buckets": buckets,
+        }
@@ -0,0 +1,97 @@
+"""
+Migration script to rewrite pickled face encodings in the binary codec format
+
+With a precision (float32, float16 or int8) every row not already stored at
+that precision is rewritten too, e.g. to shrink the database after setting
+ENCODING_STORAGE. Run evaluate_precision.py first to check the accuracy cost.
+
+Usage: python migrate_encodings.py [batch_size] [precision]
+"""
+import sqlite3
+import os
+import sys
+
+import encoding_codec
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "face_attendance.db")
+
+TABLES = ("employees", "face_samples")
+BATCH_SIZE = 500
+
+
+def convert_table(conn, table, batch_size=BATCH_SIZE, precision=None):
+    """Rewrite legacy rows (and rows at another precision) of one table in place,
+    one batch per transaction"""
+    target_dtype = encoding_codec.PRECISIONS[precision] if precision else None
+    cursor = conn.cursor()
+    converted = 0
+    skipped = 0
+    last_id = 0
+
+    while True:
+        cursor.execute(
+            f"SELECT id, face_encoding FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, batch_size),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        updates = []
+        for row_id, blob in rows:
+            if blob is None:
+                continue
+            try:
+                if encoding_codec.is_legacy(blob):
+                    encoder_version = encoding_codec.LEGACY_ENCODER_VERSION
+                else:
+                    header = encoding_codec.read_header(blob)
+                    if target_dtype is None or header.dtype == target_dtype:
+                        continue
+                    encoder_version = header.encoder_version
+                encoding = encoding_codec.decode(blob)
+            except encoding_codec.EncodingFormatError as e:
+                print(f"⚠ {table} row {row_id}: {e}")
+                skipped += 1
+                continue
+            updates.append((encoding_codec.encode(encoding, encoder_version, precision or "float32"), row_id))
+
+        if updates:
+            cursor.executemany(f"UPDATE {table} SET face_encoding = ? WHERE id = ?", updates)
+            conn.commit()
+            converted += len(updates)
+
+    return converted, skipped
+
+
+def migrate(batch_size=BATCH_SIZE, precision=None):
+    print(f"Connecting to database: {DB_PATH}")
+    conn = sqlite3.connect(DB_PATH)
+
+    try:
+        for table in TABLES:
+            cursor = conn.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+            if not cursor.fetchone():
+                print(f"⚠ {table} table not found, skipping")
+                continue
+
+            converted, skipped = convert_table(conn, table, batch_size, precision)
+            print(f"✓ {table}: {converted} rows converted, {skipped} unreadable rows left as-is")
+
+        if precision:
+            # Rewritten rows are smaller; give the freed pages back to the filesystem
+            conn.execute("VACUUM")
+        print("✓ Migration completed successfully!")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"✗ Migration failed: {e}")
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    migrate(int(sys.argv[1]) if len(sys.argv) > 1 else BATCH_SIZE, sys.argv[2] if len(sys.argv) > 2 else None)
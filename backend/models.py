@@ -17,6 +17,7 @@ class Employee(Base):
     # Relationships
     attendance_records = relationship("Attendance", back_populates="employee", cascade="all, delete-orphan")
     face_samples = relationship("FaceSample", back_populates="employee", cascade="all, delete-orphan")
+    prototypes = relationship("FacePrototype", cascade="all, delete-orphan", uselist=False)
     
     def __repr__(self):
         return f"<Employee(id={self.id}, name='{self.name}', email='{self.email}')>"
@@ -39,6 +40,25 @@ class FaceSample(Base):
         return f"<FaceSample(id={self.id}, employee_id={self.employee_id})>"
 
 
+class FacePrototype(Base):
+    """Compressed matching set for an employee, built by build_prototypes.py"""
+    __tablename__ = "face_prototypes"
+    
+    employee_id = Column(Integer, ForeignKey('employees.id', ondelete='CASCADE'), primary_key=True)
+    prototype_ids = Column(String(500), nullable=False)  # Comma-separated medoid sample ids (-1 = primary encoding)
+    outlier_ids = Column(String(500), default="")  # Samples kept because they are far from every medoid
+    max_sample_id = Column(Integer, nullable=False)  # Samples added after the build are always matched
+    built_at = Column(DateTime, default=datetime.utcnow)
+    
+    def sample_ids(self):
+        """Every sample id in the compressed set"""
+        ids = f"{self.prototype_ids},{self.outlier_ids or ''}".split(",")
+        return frozenset(int(i) for i in ids if i)
+    
+    def __repr__(self):
+        return f"<FacePrototype(employee_id={self.employee_id}, prototypes='{self.prototype_ids}')>"
+
+
 class Attendance(Base):
     __tablename__ = "attendance"
 
@@ -0,0 +1,22 @@
+"""Synthetic face images for tests and benchmarks
+
+Drawn with OpenCV primitives, so no image files or network access are needed.
+"""
+import cv2
+import numpy as np
+
+
+def draw_face(seed, size=480):
+    """Synthetic frontal face the Haar cascade detects reliably"""
+    rng = np.random.default_rng(seed)
+    img = np.full((size, size * 4 // 3, 3), (90, 110, 130), np.uint8)
+    cx, cy = img.shape[1] // 2 + int(rng.integers(-20, 20)), size // 2
+    cv2.ellipse(img, (cx, cy), (80, 105), 0, 0, 360, (150, 180, 215), -1)
+    for dx in (-32, 32):
+        cv2.ellipse(img, (cx + dx, cy - 25), (17, 9), 0, 0, 360, (255, 255, 255), -1)
+        cv2.circle(img, (cx + dx, cy - 25), 7, (40, 30, 30), -1)
+        cv2.line(img, (cx + dx - 20, cy - 48), (cx + dx + 20, cy - 50), (40, 40, 60), 5)
+    cv2.line(img, (cx, cy - 15), (cx - 8, cy + 25), (110, 130, 170), 4)
+    cv2.ellipse(img, (cx, cy + 50), (30, 10), 0, 0, 180, (60, 60, 150), 5)
+    img = cv2.GaussianBlur(img, (5, 5), 0)
+    return np.clip(img + rng.normal(0, 6, img.shape), 0, 255).astype(np.uint8)
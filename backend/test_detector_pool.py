@@ -0,0 +1,71 @@
+"""
+Stress test: hammer get_face_encoding from many threads through the detector pool
+and check every result matches the single-threaded result for the same frame.
+Run this from the backend/ directory: python test_detector_pool.py
+"""
+
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Add backend root to path
+backend_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_root)
+
+import face_utils
+from detector_pool import DetectorPool
+from synthetic_faces import draw_face
+
+THREADS = 16
+ROUNDS = 8
+
+
+def make_frames():
+    frames = [draw_face(seed) for seed in range(6)]
+    # Frames that fail at different stages: no face, blank, two faces
+    frames.append(np.random.default_rng(99).integers(0, 256, (480, 640, 3), dtype=np.uint8))
+    frames.append(np.full((480, 640, 3), 128, np.uint8))
+    frames.append(np.hstack([draw_face(7), draw_face(8)]))
+    return frames
+
+
+def same_result(a, b):
+    (enc_a, issues_a), (enc_b, issues_b) = a, b
+    if issues_a != issues_b:
+        return False
+    if enc_a is None or enc_b is None:
+        return enc_a is None and enc_b is None
+    return np.array_equal(enc_a, enc_b)
+
+
+def test_concurrent_encodings_are_deterministic():
+    frames = make_frames()
+    expected = [face_utils.get_face_encoding(frame) for frame in frames]
+    assert any(result[0] is not None for result in expected), "No synthetic face was encoded"
+
+    original_pool = face_utils.detector_pool
+    face_utils.detector_pool = DetectorPool(face_utils._create_detector, size=4)
+    try:
+        jobs = [i % len(frames) for i in range(len(frames) * ROUNDS * 2)]
+        with ThreadPoolExecutor(max_workers=THREADS) as executor:
+            results = list(executor.map(lambda i: face_utils.get_face_encoding(frames[i]), jobs))
+        stats = face_utils.detector_pool.stats()
+    finally:
+        face_utils.detector_pool = original_pool
+
+    mismatches = [i for i, result in zip(jobs, results) if not same_result(result, expected[i])]
+    assert not mismatches, f"{len(mismatches)} of {len(jobs)} concurrent results differ from serial results"
+    assert stats["created"] <= 4
+    print(f"✓ {len(jobs)} concurrent encodings on {THREADS} threads match serial results "
+          f"({stats['created']} detectors used)")
+
+
+if __name__ == "__main__":
+    try:
+        test_concurrent_encodings_are_deterministic()
+    except AssertionError as e:
+        print(f"FAILED: {e}")
+        sys.exit(1)
+    print("\n✅ Detector pool stress test passed!")
@@ -0,0 +1,112 @@
+"""
+Allocation test: the handcrafted encoder's steady state must not allocate image-sized buffers
+Traces numpy/Python allocations with tracemalloc while encoding the same face
+repeatedly through an EncodingWorkspace, takes a snapshot after every call and
+checks how many blocks each call leaves allocated, how many accumulate per
+call on average, and that the per-call peak stays below the size of a single
+128x128 working image.
+Run this from the backend/ directory: python test_encoding_allocations.py
+"""
+
+import sys
+import os
+import tracemalloc
+
+import cv2
+import numpy as np
+
+# Add backend root to path
+backend_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_root)
+
+import face_utils
+from synthetic_faces import draw_face
+
+CALLS = 200
+# Blocks a single call may leave allocated, counted with a snapshot on each side of it.
+# The buffers are reused; what remains are a few small Python objects (argument
+# tuples, slices) that CPython frees on a later call
+MAX_BLOCKS_PER_CALL = 6
+# Average over all calls: anything above this grows without bound
+MAX_MEAN_BLOCKS_PER_CALL = 0.05
+# Per-call peak: the HOG descriptor OpenCV returns plus small Python objects; one
+# 128x128 gray image alone is 16 KB
+MAX_PEAK_BYTES = 4096
+
+
+def face_region(seed=0):
+    return draw_face(seed)[100:380, 150:480]
+
+
+def traced_calls(fn, calls=CALLS):
+    """(most blocks a single call left allocated, mean blocks per call, largest per-call peak in bytes)
+
+    Blocks are traced allocations attributed to face_utils (numpy and OpenCV
+    buffers are attributed to the face_utils line that requested them).
+    """
+    for _ in range(3):
+        fn()  # First calls size the buffers
+    filters = [tracemalloc.Filter(True, face_utils.__file__)]
+    tracemalloc.start()
+    try:
+        first = before = tracemalloc.take_snapshot().filter_traces(filters)
+        worst_blocks = worst_peak = 0
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            fn()
+            worst_peak = max(worst_peak, tracemalloc.get_traced_memory()[1] - current)
+            after = tracemalloc.take_snapshot().filter_traces(filters)
+            blocks = sum(max(0, stat.count_diff) for stat in after.compare_to(before, "lineno"))
+            worst_blocks = max(worst_blocks, blocks)
+            before = after
+    finally:
+        tracemalloc.stop()
+    total = sum(stat.count_diff for stat in after.compare_to(first, "lineno"))
+    return worst_blocks, total / calls, worst_peak
+
+
+def check_steady_state(name, fn):
+    blocks, mean_blocks, peak = traced_calls(fn)
+    assert blocks <= MAX_BLOCKS_PER_CALL, f"{name} left {blocks} blocks allocated in a single call"
+    assert mean_blocks <= MAX_MEAN_BLOCKS_PER_CALL, f"{name} leaks {mean_blocks:.3f} blocks per call"
+    assert peak <= MAX_PEAK_BYTES, f"{name} peaked at {peak} bytes per call"
+    print(f"✓ {name}: at most {blocks} blocks per call ({mean_blocks:.3f} on average over {CALLS} calls), "
+          f"{peak} bytes peak")
+
+
+def test_workspace_matches_fresh_encoding():
+    region = face_region()
+    out = np.empty(face_utils.ENCODING_DIM, dtype=np.float32)
+    workspace = face_utils.EncodingWorkspace()
+    for seed in range(3):
+        workspace.encode(face_region(seed + 1), out)  # Leave stale values in the buffers
+    assert np.array_equal(workspace.encode(region, out), face_utils.EncodingWorkspace().encode(region))
+    assert np.array_equal(out[96:96 + face_utils.HOG_FEATURES],
+                          face_utils.compute_hog_features(workspace.gray, compat=True))
+    print("✓ Reused workspace buffers give the same encoding as fresh ones")
+
+
+def test_encode_steady_state_allocations():
+    region = face_region()
+    out = np.empty(face_utils.ENCODING_DIM, dtype=np.float32)
+    workspace = face_utils.EncodingWorkspace()
+    check_steady_state("encode()", lambda: workspace.encode(region, out))
+
+
+def test_laplacian_steady_state_allocations():
+    gray = np.ascontiguousarray(face_region()[:, :, 1])
+    workspace = face_utils.EncodingWorkspace()
+    assert abs(workspace.laplacian_var(gray) - cv2.Laplacian(gray, cv2.CV_64F).var()) < 1e-6
+    check_steady_state("laplacian_var()", lambda: workspace.laplacian_var(gray))
+
+
+if __name__ == "__main__":
+    try:
+        test_workspace_matches_fresh_encoding()
+        test_encode_steady_state_allocations()
+        test_laplacian_steady_state_allocations()
+    except AssertionError as e:
+        print(f"FAILED: {e}")
+        sys.exit(1)
+    print("\n✅ Encoding allocation test passed!")
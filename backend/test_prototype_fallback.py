@@ -0,0 +1,84 @@
+"""
+Recall test: prototype-compressed identify() must pick the same employee as a full scan
+Builds prototypes for a synthetic gallery and finds borderline probes, whose
+winner changes when the prototype scores are used without exact rescoring;
+with the default fallback settings compact mode must agree with the full
+scan on every probe, borderline ones included.
+Run this from the backend/ directory: python test_prototype_fallback.py
+"""
+
+import sys
+import os
+
+import numpy as np
+
+# Add backend root to path
+backend_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_root)
+
+from config import Config
+from face_gallery import FaceGallery
+from benchmark_ann import DIM, make_gallery_arrays
+from benchmark_prototypes import build_prototypes
+
+EMPLOYEES = 200
+SAMPLES = 20
+PROBES = 300
+TOLERANCE = 0.50  # As the kiosk uses
+
+
+def make_galleries():
+    rng = np.random.default_rng(1)
+    centres, rows, owners, sample_ids, entries = make_gallery_arrays(EMPLOYEES, SAMPLES, rng)
+    # Enrolled employees and strangers; strangers score close to many employees at once
+    truth = rng.integers(0, EMPLOYEES, PROBES)
+    probes = centres[truth] + rng.normal(0, 0.08, (PROBES, DIM)).astype(np.float32)
+    probes[: PROBES // 2] = rng.random((PROBES // 2, DIM)).astype(np.float32)
+
+    Config.ANN_ENABLED = False
+    Config.PROTOTYPES_ENABLED = True
+    full = FaceGallery()
+    full.load_arrays(rows, owners, sample_ids, entries)
+    compact = FaceGallery()
+    compact.load_arrays(rows, owners, sample_ids, entries, prototypes=build_prototypes(rows, owners, sample_ids))
+    assert compact.compact is not None, "prototypes were not used"
+    return probes, full, compact
+
+
+def identify_ids(gallery, probes):
+    results = []
+    for probe in probes:
+        best, confidence, _ = gallery.identify(probe, TOLERANCE)
+        results.append((best.id if best else None, confidence))
+    return results
+
+
+def test_compact_matches_full_scan():
+    probes, full, compact = make_galleries()
+    expected = identify_ids(full, probes)
+
+    top_k = Config.PROTOTYPE_RESCORE_TOP_K
+    Config.PROTOTYPE_RESCORE_TOP_K = 0
+    try:
+        unrescored = identify_ids(compact, probes)
+    finally:
+        Config.PROTOTYPE_RESCORE_TOP_K = top_k
+    borderline = [i for i, (a, b) in enumerate(zip(expected, unrescored)) if a[0] != b[0]]
+    assert borderline, "no borderline probes: prototype scores alone already agree with the full scan"
+
+    actual = identify_ids(compact, probes)
+    wrong = [i for i, (a, b) in enumerate(zip(expected, actual)) if a[0] != b[0]]
+    assert not wrong, f"compact identify() picked a different employee for probes {wrong}"
+    assert all(abs(expected[i][1] - actual[i][1]) < 1e-5 for i in borderline), \
+        "borderline confidences differ from the full scan"
+    print(f"✓ Compact identify() agrees with the full scan on {len(probes)} probes "
+          f"({len(borderline)} borderline)")
+
+
+if __name__ == "__main__":
+    try:
+        test_compact_matches_full_scan()
+    except AssertionError as e:
+        print(f"FAILED: {e}")
+        sys.exit(1)
+    print("\n✅ Prototype fallback test passed!")